@@ -0,0 +1,127 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Accuracy versus speed report of precisions of IntentClassifier.
+
+For each precision, it reports the precision actually loaded (bf16 falls back to fp32
+on CPUs without bfloat16 support), accuracy on small labelled sentences,
+agreement of predictions with fp32, latency per sentence and speedup over fp32.
+
+Examples:
+    $ python benchmarks/precision.py --lang en --repeat 5 --threads 4
+"""
+
+import time
+import argparse
+
+import torch
+
+from dialobot.core.intent import IntentClassifier
+from dialobot.core.utils.model import PRECISIONS
+
+INTENTS = {
+    "en": ["weather", "restaurant", "time", "music"],
+    "ko": ["날씨", "식당", "시간", "음악"],
+    "ja": ["気象条件", "食堂", "時間", "音楽"],
+    "zh": ["天气", "饭厅", "时间", "音乐"],
+}
+
+SENTENCES = {
+    "en": [
+        ("Tell me today's weather", "weather"),
+        ("Will it rain tomorrow?", "weather"),
+        ("Recommend a good restaurant nearby", "restaurant"),
+        ("Where can I eat pasta tonight?", "restaurant"),
+        ("What time is it now?", "time"),
+        ("Tell me the current time", "time"),
+        ("Play some jazz music", "music"),
+        ("I want to listen to a song", "music"),
+    ],
+    "ko": [
+        ("날씨 알려줘", "날씨"),
+        ("내일 비 와?", "날씨"),
+        ("근처 맛집 추천해줘", "식당"),
+        ("저녁 먹을 식당 찾아줘", "식당"),
+        ("지금 몇 시야?", "시간"),
+        ("현재 시간 알려줘", "시간"),
+        ("신나는 노래 틀어줘", "음악"),
+        ("음악 듣고 싶어", "음악"),
+    ],
+    "ja": [
+        ("今日の天気を教えて。", "気象条件"),
+        ("明日は雨が降りますか。", "気象条件"),
+        ("近くの美味しい食堂を教えて。", "食堂"),
+        ("今何時ですか。", "時間"),
+        ("音楽をかけて。", "音楽"),
+    ],
+    "zh": [
+        ("告诉我天气", "天气"),
+        ("明天会下雨吗", "天气"),
+        ("推荐一家饭厅", "饭厅"),
+        ("现在几点了", "时间"),
+        ("播放音乐", "音乐"),
+    ],
+}
+
+
+def loaded(clf: IntentClassifier) -> str:
+    if any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in clf.model.modules()):
+        return "int8-dynamic"
+
+    dtype = next(clf.model.parameters()).dtype
+    return {torch.float32: "fp32", torch.bfloat16: "bf16"}.get(dtype, str(dtype))
+
+
+def run(clf: IntentClassifier, lang: str, repeat: int):
+    sentences = SENTENCES[lang]
+    clf.recognize(sentences[0][0], intents=INTENTS[lang])  # warm up
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        outputs = [
+            clf.recognize(text, intents=INTENTS[lang])
+            for text, _ in sentences
+        ]
+    latency = (time.perf_counter() - start) / (repeat * len(sentences))
+
+    accuracy = sum(o == label for o, (_, label) in zip(outputs, sentences)) / len(sentences)
+    return outputs, accuracy, latency * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lang", default="en", choices=list(INTENTS.keys()))
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--threads", default=None, type=int)
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    reference, rows = None, []
+    for precision in PRECISIONS:
+        clf = IntentClassifier(lang=args.lang, precision=precision)
+        outputs, accuracy, latency = run(clf, args.lang, args.repeat)
+        reference = reference or (outputs, latency)
+        agreement = sum(o == r for o, r in zip(outputs, reference[0])) / len(outputs)
+        rows.append((precision, loaded(clf), accuracy, agreement, latency, reference[1] / latency))
+
+    print(f"{'precision':<16}{'loaded':<16}{'accuracy':<10}{'agreement':<11}{'latency(ms)':<13}speedup")
+    for precision, dtype, accuracy, agreement, latency, speedup in rows:
+        print(f"{precision:<16}{dtype:<16}{accuracy:<10.3f}{agreement:<11.3f}{latency:<13.2f}{speedup:.2f}")
+
+
+if __name__ == "__main__":
+    main()
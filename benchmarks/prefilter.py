@@ -0,0 +1,103 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Recall versus k report of EntityPrefilter.
+
+For each k, it reports recall of labelled entities of nouns in top-k candidates,
+recall of entities chosen by Ner without prefilter (with --nli),
+ratio of NLI pairs to score and latency of prefilter per noun.
+
+Examples:
+    $ python benchmarks/prefilter.py --lang en --nli
+"""
+
+import time
+import argparse
+
+from dialobot.core.entity import EntityPrefilter, Ner
+
+ENTITIES = {
+    "en": ["food", "city", "country", "person", "animal", "color", "date",
+           "time", "music", "sport", "vehicle", "company"],
+    "ko": ["음식", "도시", "나라", "사람", "동물", "색깔", "날짜",
+           "시간", "음악", "운동", "탈것", "회사"],
+    "zh": ["食物", "城市", "国家", "人", "动物", "颜色", "日期",
+           "时间", "音乐", "运动", "车辆", "公司"],
+}
+
+NOUNS = {
+    "en": [
+        ("pizza", "food"), ("pasta", "food"), ("Seoul", "city"), ("Paris", "city"),
+        ("Korea", "country"), ("Germany", "country"), ("teacher", "person"), ("Obama", "person"),
+        ("dog", "animal"), ("tiger", "animal"), ("red", "color"), ("blue", "color"),
+        ("Monday", "date"), ("Christmas", "date"), ("noon", "time"), ("midnight", "time"),
+        ("jazz", "music"), ("symphony", "music"), ("soccer", "sport"), ("tennis", "sport"),
+        ("bus", "vehicle"), ("bicycle", "vehicle"), ("Samsung", "company"), ("Google", "company"),
+    ],
+    "ko": [
+        ("피자", "음식"), ("김치찌개", "음식"), ("서울", "도시"), ("부산", "도시"),
+        ("한국", "나라"), ("독일", "나라"), ("선생님", "사람"), ("친구", "사람"),
+        ("강아지", "동물"), ("호랑이", "동물"), ("빨강", "색깔"), ("파랑", "색깔"),
+        ("월요일", "날짜"), ("크리스마스", "날짜"), ("정오", "시간"), ("자정", "시간"),
+        ("재즈", "음악"), ("교향곡", "음악"), ("축구", "운동"), ("테니스", "운동"),
+        ("버스", "탈것"), ("자전거", "탈것"), ("삼성", "회사"), ("구글", "회사"),
+    ],
+    "zh": [
+        ("比萨", "食物"), ("面条", "食物"), ("首尔", "城市"), ("上海", "城市"),
+        ("韩国", "国家"), ("德国", "国家"), ("老师", "人"), ("朋友", "人"),
+        ("狗", "动物"), ("老虎", "动物"), ("红色", "颜色"), ("蓝色", "颜色"),
+        ("星期一", "日期"), ("圣诞节", "日期"), ("中午", "时间"), ("午夜", "时间"),
+        ("爵士乐", "音乐"), ("交响曲", "音乐"), ("足球", "运动"), ("网球", "运动"),
+        ("公共汽车", "车辆"), ("自行车", "车辆"), ("三星", "公司"), ("谷歌", "公司"),
+    ],
+}
+
+
+def recall(candidates, entities, labels):
+    return sum(entities.index(label) in c for c, label in zip(candidates, labels)) / len(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lang", default="en", choices=list(ENTITIES.keys()))
+    parser.add_argument("--nli", action="store_true", help="compare with entities chosen by Ner")
+    args = parser.parse_args()
+
+    entities = ENTITIES[args.lang]
+    nouns, labels = zip(*NOUNS[args.lang])
+    prefilter = EntityPrefilter(topk=1)
+    prefilter.candidates(list(nouns), entities)  # warm up entity embeddings
+
+    chosen = None
+    if args.nli:
+        ner = Ner(lang=args.lang)
+        chosen = [e for e, _ in ner.classify(list(nouns), entities).values()]
+
+    print(f"{'k':<5}{'recall':<9}{'nli_recall':<12}{'pairs':<8}latency(ms)")
+    for k in range(1, len(entities) + 1):
+        prefilter.topk = k
+        prefilter.cache.clear()
+
+        start = time.perf_counter()
+        candidates = prefilter.candidates(list(nouns), entities)
+        latency = (time.perf_counter() - start) / len(nouns)
+
+        nli_recall = recall(candidates, entities, chosen) if chosen else float("nan")
+        print(f"{k:<5}{recall(candidates, entities, labels):<9.3f}{nli_recall:<12.3f}"
+              f"{k / len(entities):<8.3f}{latency * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    main()
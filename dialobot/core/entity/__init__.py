@@ -13,3 +13,6 @@
 # limitations under the License.
 
 from dialobot.core.entity.recognizer import Ner
+from dialobot.core.entity.gazetteer import Gazetteer
+from dialobot.core.entity.prefilter import EntityPrefilter
+from dialobot.core.entity.memo import EntityMemo
@@ -0,0 +1,184 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Morphological analyzers of Ner, built once per process and shared by threads.
+
+- en: NLTK tokenizer and perceptron tagger. resources are looked up in local paths
+    of NLTK and `NLTK_PATH`, and missing ones are downloaded to `NLTK_PATH` by `download`.
+- ko: pynori KoreanAnalyzer. it is not thread-safe, so analysis is serialized.
+- zh: jieba. prefix dictionary is cached in `JIEBA_PATH` and loaded from it.
+
+Examples:
+    >>> tokens, nouns = analyze("en", "please order Cheese Pizza.")
+"""
+
+import os
+import threading
+import warnings
+from typing import Any, Dict, List, Tuple
+
+import nltk
+import jieba
+from jieba import posseg as pseg
+from nltk.tokenize import word_tokenize
+from nltk.tag.perceptron import PerceptronTagger
+from pynori.korean_analyzer import KoreanAnalyzer
+
+NLTK_PATH = os.path.join(os.path.expanduser('~'), ".dialobot", "nltk_data/")
+JIEBA_PATH = os.path.join(os.path.expanduser('~'), ".dialobot", "jieba/")
+
+# resources were renamed in NLTK 3.9 not to load pickles.
+if tuple(int(v) for v in nltk.__version__.split(".")[:2]) >= (3, 9):
+    NLTK_RESOURCES = {
+        "punkt_tab": "tokenizers/punkt_tab",
+        "averaged_perceptron_tagger_eng": "taggers/averaged_perceptron_tagger_eng",
+    }
+else:
+    NLTK_RESOURCES = {
+        "punkt": "tokenizers/punkt",
+        "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    }
+
+_lock = threading.Lock()
+_analyzers: Dict[str, Any] = {}
+_korean_lock = threading.Lock()
+
+
+def _missing_resources() -> List[str]:
+    if NLTK_PATH not in nltk.data.path:
+        nltk.data.path.append(NLTK_PATH)
+
+    missing = []
+    for name, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(name)
+
+    return missing
+
+
+def download() -> None:
+    """
+    Download NLTK resources of English analyzer to `NLTK_PATH`
+    if they are not found locally. It needs network access.
+    It is called by `Ner(lang="en")` unless `download=False` is given.
+
+    Examples:
+        >>> download()
+        >>> ner = Ner(lang="en", download=False)
+    """
+
+    missing = _missing_resources()
+    if len(missing) != 0:
+        warnings.warn(f"NLTK resources {missing} are not found, they are downloaded to {NLTK_PATH}.")
+
+    for name in missing:
+        nltk.download(name, download_dir=NLTK_PATH, quiet=True)
+
+
+def _build_english() -> PerceptronTagger:
+    missing = _missing_resources()
+    if len(missing) != 0:
+        raise Exception(
+            f"NLTK resources {missing} for English are not found in {nltk.data.path}.\n"
+            f"please download them using below codes.\n"
+            f">>> ner = Ner(lang='en', download=True)\n"
+            f"or\n"
+            f">>> import nltk\n"
+            + "".join(f">>> nltk.download('{name}', download_dir='{NLTK_PATH}')\n" for name in missing))
+
+    word_tokenize("load punkt")
+    # `nltk.pos_tag` loads the tagger for every call.
+    return PerceptronTagger()
+
+
+def _build_korean() -> KoreanAnalyzer:
+    return KoreanAnalyzer(
+        decompound_mode='None',
+        infl_decompound_mode='DISCARD',
+        discard_punctuation=True,
+        output_unknown_unigrams=False,
+        pos_filter=False,
+        synonym_filter=False,
+    )
+
+
+def _build_chinese() -> jieba.Tokenizer:
+    os.makedirs(JIEBA_PATH, exist_ok=True)
+    jieba.dt.tmp_dir = JIEBA_PATH
+    jieba.initialize()
+    return jieba.dt
+
+
+_BUILDERS = {
+    "en": _build_english,
+    "ko": _build_korean,
+    "zh": _build_chinese,
+}
+
+
+def load(lang: str) -> Any:
+    """
+    Build analyzer of language for the first time, and return the shared one later.
+
+    Args:
+        lang (str): one of ['en', 'ko', 'zh']
+
+    Returns:
+        (Any): analyzer of language
+    """
+
+    analyzer = _analyzers.get(lang)
+    if analyzer is None:
+        with _lock:
+            if lang not in _analyzers:
+                _analyzers[lang] = _BUILDERS[lang]()
+            analyzer = _analyzers[lang]
+
+    return analyzer
+
+
+def analyze(lang: str, text: str) -> Tuple[List[str], List[str]]:
+    """
+    Args:
+        lang (str): one of ['en', 'ko', 'zh']
+        text (str): input sentence
+
+    Returns:
+        (Tuple[List[str], List[str]]): tokens and nouns of sentence
+    """
+
+    analyzer = load(lang)
+
+    if lang == "en":
+        tokens = word_tokenize(text)
+        nouns = [w for w, p in analyzer.tag(tokens) if "NN" in p]
+
+    elif lang == "ko":
+        with _korean_lock:
+            nori_tokenize = analyzer.do_analysis(text)
+        tokens = nori_tokenize['termAtt']
+        nouns = [w for w, p in zip(nori_tokenize['termAtt'], nori_tokenize['posTagAtt']) if "NN" in p]
+
+    elif lang == "zh":
+        pos_tag = pseg.lcut(text)
+        tokens = [w for w, p in pos_tag]
+        nouns = [w for w, p in pos_tag if "n" in p]
+
+    else:
+        raise Exception(f"wrong language: {lang}")
+
+    return tokens, nouns
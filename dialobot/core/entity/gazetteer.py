@@ -0,0 +1,319 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pickle
+import threading
+import unicodedata
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple, Union
+
+# (goto, fail, output) of each state of automaton.
+# output of a state is (length, entity) of every word ending at the state.
+Automaton = Tuple[List[Dict[str, int]], List[int], List[Tuple[Tuple[int, str], ...]]]
+
+
+class Gazetteer:
+
+    def __init__(
+        self,
+        path: str = os.path.join(
+            os.path.expanduser('~'),
+            ".dialobot",
+            "entity/",
+        ),
+        file: str = "gazetteer.pkl",
+    ) -> None:
+        """
+        Registered words of entities, matched by an Aho-Corasick automaton.
+
+        Words are normalized (NFKC, case folded) and matched in linear time
+        over the length of sentence, regardless of the number of words.
+        Words are matched only at word boundaries, except for CJK characters
+        which are not separated by spaces.
+        Words and compiled automaton are saved in `path` on every mutation,
+        so the automaton is not rebuilt at later startups.
+
+        Args:
+            path (str): path to save gazetteer
+            file (str): file name of gazetteer
+
+        References:
+            Efficient string matching: an aid to bibliographic search (Aho and Corasick, 1975)
+            https://doi.org/10.1145/360825.360855
+
+        Examples:
+            >>> # 1. register words
+            >>> gazetteer = Gazetteer()
+            >>> gazetteer.add("FOOD", ["Cheese Pizza", "pasta"])
+            >>> gazetteer.add("CITY", "Seoul")
+            >>> # or register words of many entities at once
+            >>> gazetteer.add_many({"FOOD": ["Cheese Pizza", "pasta"], "CITY": ["Seoul"]})
+            >>> # 2. match words in sentence
+            >>> gazetteer.match("please order cheese pizza in Seoul.")
+            [(13, 25, 'FOOD'), (29, 34, 'CITY')]
+            >>> # 3. use it for Ner, nouns covered by words are not sent to NLI
+            >>> ner = Ner(lang="en", gazetteer=gazetteer)
+        """
+
+        self.file = os.path.join(path, file)
+        self.lock = threading.Lock()
+
+        # normalized word -> entity
+        self.entries: Dict[str, str] = {}
+        self.automaton: Automaton = _compile(self.entries)
+
+        if os.path.exists(self.file):
+            with open(self.file, "rb") as fp:
+                self.entries, self.automaton = pickle.load(fp)
+
+    @staticmethod
+    def normalize(text: str) -> Tuple[str, List[int]]:
+        """
+        Args:
+            text (str): input text
+
+        Returns:
+            (Tuple[str, List[int]]): normalized text and position in `text`
+                of each character of normalized text
+
+        Note:
+            Characters are normalized one by one, so positions of matches
+            can be mapped back to the input text.
+        """
+
+        chars, positions = [], []
+        for i, char in enumerate(text):
+            normalized = unicodedata.normalize("NFKC", char).casefold()
+            chars.append(normalized)
+            positions.extend([i] * len(normalized))
+
+        return "".join(chars), positions
+
+    def add(self, entity: str, words: Union[str, List[str]]) -> None:
+        """
+        Register words of entity.
+        A word belongs to only one entity, so a word registered again moves to `entity`.
+
+        Args:
+            entity (str): name of entity
+            words (Union[str, List[str]]): word or list of words
+
+        Notes:
+            Every mutation recompiles the automaton and rewrites the file,
+            which costs O(total length of words). use `add_many` to register many entities.
+        """
+
+        self.add_many({entity: words})
+
+    def add_many(self, words: Dict[str, Union[str, List[str]]]) -> None:
+        """
+        Register words of many entities with one recompilation.
+
+        Args:
+            words (Dict[str, Union[str, List[str]]]): entity -> word or list of words
+        """
+
+        with self.lock:
+            entries = dict(self.entries)
+            for entity, values in words.items():
+                values = [values] if isinstance(values, str) else values
+                for word in values:
+                    word = self.normalize(word)[0]
+                    if len(word) != 0:
+                        entries[word] = entity
+
+            self._update(entries)
+
+    def remove(self, entity: str, words: Optional[Union[str, List[str]]] = None) -> None:
+        """
+        Args:
+            entity (str): name of entity
+            words (Optional[Union[str, List[str]]]): word or list of words.
+                every word of entity is removed if it is None.
+
+        Notes:
+            Like `add`, it recompiles the automaton and rewrites the file,
+            so remove many words in one call.
+        """
+
+        words = [words] if isinstance(words, str) else words
+
+        with self.lock:
+            if words is None:
+                entries = {w: e for w, e in self.entries.items() if e != entity}
+            else:
+                removed = {self.normalize(word)[0] for word in words}
+                entries = {
+                    w: e for w, e in self.entries.items()
+                    if not (e == entity and w in removed)
+                }
+
+            self._update(entries)
+
+    def words(self, entity: str) -> List[str]:
+        """
+        Args:
+            entity (str): name of entity
+
+        Returns:
+            (List[str]): normalized words of entity
+        """
+
+        return sorted(w for w, e in self.entries.items() if e == entity)
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Returns:
+            (Dict[str, int]): number of registered words of each entity
+        """
+
+        return dict(Counter(self.entries.values()))
+
+    def match(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Find registered words in text.
+        Words inside of other words (e.g. "ice cream" in "rice cream") are not matched,
+        and overlapped matches are resolved by the leftmost and the longest one.
+
+        Args:
+            text (str): input sentence
+
+        Returns:
+            (List[Tuple[int, int, str]]): (start, end, entity) of each match,
+                where `text[start:end]` is the matched word
+        """
+
+        goto, fail, output = self.automaton
+        normalized, positions = self.normalize(text)
+        matches, state = [], 0
+
+        for i, char in enumerate(normalized):
+            while state != 0 and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for length, entity in output[state]:
+                start = i + 1 - length
+                if _is_boundary(normalized, start) and _is_boundary(normalized, i + 1):
+                    matches.append((start, i + 1, entity))
+
+        results, end = [], 0
+        for start, stop, entity in sorted(matches, key=lambda m: (m[0], -m[1])):
+            if start >= end:
+                results.append((positions[start], positions[stop - 1] + 1, entity))
+                end = stop
+
+        return results
+
+    def cover(
+        self,
+        text: str,
+        tokens: List[str],
+        entities: Optional[List[str]] = None,
+    ) -> Dict[str, str]:
+        """
+        Find tokens which are inside of matched words.
+
+        Args:
+            text (str): input sentence
+            tokens (List[str]): tokens of sentence in order
+            entities (Optional[List[str]]): entities to match. every entity is matched if it is None.
+
+        Returns:
+            (Dict[str, str]): token -> entity of covered tokens
+        """
+
+        matches = [m for m in self.match(text) if entities is None or m[2] in entities]
+        if len(matches) == 0:
+            return {}
+
+        covered, cursor = {}, 0
+        for token in tokens:
+            # tokens changed by tokenizer are not found in text, and they are not covered.
+            start = text.find(token, cursor)
+            if start == -1:
+                continue
+
+            cursor = end = start + len(token)
+            for begin, stop, entity in matches:
+                if begin <= start and end <= stop:
+                    covered[token] = entity
+                    break
+
+        return covered
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _update(self, entries: Dict[str, str]) -> None:
+        automaton = _compile(entries)
+
+        os.makedirs(os.path.dirname(self.file), exist_ok=True)
+        with open(self.file + ".tmp", "wb") as fp:
+            pickle.dump((entries, automaton), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.file + ".tmp", self.file)
+
+        # replaced at once not to break concurrent matching
+        self.entries, self.automaton = entries, automaton
+
+
+def _is_word(char: str) -> bool:
+    # CJK characters are not separated by spaces, so they are not treated as word characters.
+    code = ord(char)
+    cjk = (
+        0x1100 <= code <= 0x11FF  # Hangul Jamo
+        or 0x3040 <= code <= 0x30FF  # Hiragana, Katakana
+        or 0x3130 <= code <= 0x318F  # Hangul Compatibility Jamo
+        or 0x3400 <= code <= 0x4DBF  # CJK Unified Ideographs Extension A
+        or 0x4E00 <= code <= 0x9FFF  # CJK Unified Ideographs
+        or 0xAC00 <= code <= 0xD7A3  # Hangul Syllables
+    )
+    return char.isalnum() and not cjk
+
+
+def _is_boundary(text: str, i: int) -> bool:
+    return i == 0 or i == len(text) or not (_is_word(text[i - 1]) and _is_word(text[i]))
+
+
+def _compile(entries: Dict[str, str]) -> Automaton:
+    goto: List[Dict[str, int]] = [{}]
+    output: List[Tuple[Tuple[int, str], ...]] = [()]
+
+    for word, entity in entries.items():
+        state = 0
+        for char in word:
+            if char not in goto[state]:
+                goto[state][char] = len(goto)
+                goto.append({})
+                output.append(())
+            state = goto[state][char]
+        output[state] = ((len(word), entity),)
+
+    # failure links are built in breadth first order,
+    # so outputs of shorter suffixes are merged before longer ones.
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+
+    while queue:
+        state = queue.popleft()
+        for char, child in goto[state].items():
+            queue.append(child)
+            link = fail[state]
+            while link != 0 and char not in goto[link]:
+                link = fail[link]
+            fail[child] = goto[link].get(char, 0)
+            output[child] = output[child] + output[fail[child]]
+
+    return goto, fail, output
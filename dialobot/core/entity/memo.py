@@ -0,0 +1,110 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Dict, List, Optional, Tuple
+
+from dialobot.core.utils.cache import LRUCache
+
+
+class EntityMemo(LRUCache):
+
+    table = "memo"
+    key_columns = ("model", "entities", "topk", "noun")
+    value_columns = ("entity", "score")
+
+    def __init__(
+        self,
+        maxsize: int = 100000,
+        path: Optional[str] = None,
+    ) -> None:
+        """
+        Thread-safe LRU memo of entities of nouns.
+
+        Entity and score of a noun are memoized with the name of NLI model,
+        the list of entities and `topk` of prefilter, so a noun is scored only once
+        for a list of entities. The least recently used noun is evicted when the memo is full.
+
+        Args:
+            maxsize (int): maximum number of nouns in memory. memoization is disabled if it is 0.
+            path (Optional[str]): path of sqlite file to keep results on disk.
+                results evicted from memory are read from it, and it survives restarts.
+
+        Examples:
+            >>> memo = EntityMemo(path="~/.dialobot/entity/memo.db")
+            >>> ner = Ner(lang="en", memo=memo)
+            >>> ner.recognize_batch(["please order pizza", "pizza for two"], entities=["FOOD", "CITY"])
+            >>> ner.recognize("pizza is delicious", entities=["CITY", "FOOD"])
+            >>> memo.stats()
+            {'hits': 1, 'misses': 1, 'disk_hits': 0, 'size': 1}
+        """
+
+        super().__init__(maxsize=maxsize, path=path)
+
+    @staticmethod
+    def key(entities: List[str]) -> str:
+        """
+        Args:
+            entities (List[str]): List of entities
+
+        Returns:
+            (str): key of list of entities, regardless of order and duplicates
+        """
+
+        return "\x1f".join(sorted(set(entities)))
+
+    def get_many(
+        self,
+        model: str,
+        entities: List[str],
+        nouns: List[str],
+        topk: Optional[int] = None,
+    ) -> List[Optional[Tuple[str, float]]]:
+        """
+        Args:
+            model (str): name of NLI model
+            entities (List[str]): List of entities
+            nouns (List[str]): nouns to look up
+            topk (Optional[int]): `topk` of prefilter, None if nouns are scored without prefilter
+
+        Returns:
+            (List[Optional[Tuple[str, float]]]): memoized entity and score, None for missing nouns
+        """
+
+        # results pruned by prefilter may differ from ones without it.
+        prefix = (model, self.key(entities), topk or 0)
+        return self._get_many([(*prefix, noun) for noun in nouns])
+
+    def put_many(
+        self,
+        model: str,
+        entities: List[str],
+        results: Dict[str, Tuple[str, float]],
+        topk: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            model (str): name of NLI model
+            entities (List[str]): List of entities
+            results (Dict[str, Tuple[str, float]]): noun -> (entity, score)
+            topk (Optional[int]): `topk` of prefilter, None if nouns are scored without prefilter
+        """
+
+        prefix = (model, self.key(entities), topk or 0)
+        self._put_many([((*prefix, noun), (entity, float(score))) for noun, (entity, score) in results.items()])
+
+    def _dump(self, value: Tuple[str, float]) -> Tuple:
+        return value
+
+    def _load(self, row: Tuple) -> Tuple[str, float]:
+        return row[0], row[1]
@@ -0,0 +1,130 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from dialobot.core.utils.cache import EmbeddingCache
+
+
+class EntityPrefilter:
+
+    def __init__(
+        self,
+        topk: int = 3,
+        model: str = "paraphrase-multilingual-MiniLM-L12-v2",
+        encoder: Optional[Any] = None,
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = 32,
+    ) -> None:
+        """
+        Prune entity candidates of nouns with sentence embeddings before NLI.
+
+        Nouns and entities are embedded by the sentence encoder of IntentRetriever,
+        and only `topk` entities most similar to each noun are scored by NLI model.
+        Embeddings of entities are computed once and kept,
+        and embeddings of nouns are cached in `cache`.
+
+        Args:
+            topk (int): number of candidate entities of each noun
+            model (str): model name for sentence transformers
+            encoder (Optional[Any]): loaded encoder of `model` to share, e.g. `retriever.model`.
+                `SentenceTransformer(model)` is loaded if it is None.
+            cache (EmbeddingCache): cache of embeddings of nouns.
+                `EmbeddingCache()` is used if it is None. it can be shared with IntentRetriever.
+            batch_size (int): batch size for sentence encoding
+
+        Examples:
+            >>> retriever = IntentRetriever()
+            >>> prefilter = EntityPrefilter(topk=3, encoder=retriever.model, cache=retriever.cache)
+            >>> ner = Ner(lang="en", prefilter=prefilter)
+            >>> prefilter.candidates(["pizza", "Seoul"], ["FOOD", "CITY", "PERSON", "DATE"])
+            [[0, 2, 3], [1, 2, 0]]
+        """
+
+        assert topk > 0, "param `topk` must be positive"
+
+        if encoder is None:
+            encoder = SentenceTransformer(model)
+
+        self.topk = topk
+        self.model_name = model
+        self.encoder = encoder
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.batch_size = batch_size
+
+        # entity -> L2 normalized embedding
+        self.entity_vectors: Dict[str, np.ndarray] = {}
+
+    def candidates(self, nouns: List[str], entities: List[str]) -> List[List[int]]:
+        """
+        Args:
+            nouns (List[str]): nouns of input sentence
+            entities (List[str]): List of entities
+
+        Returns:
+            (List[List[int]]): indices of entities of `topk` distinct entities of each noun, most similar first.
+                entities are distinct regardless of case, so every variant (e.g. FOOD, food, Food)
+                of a candidate is a candidate. every entity is a candidate
+                if the number of distinct entities is not larger than `topk`.
+        """
+
+        # case variants of an entity have almost same embeddings,
+        # so they are pruned together not to fill `topk` with one entity.
+        variants: Dict[str, List[int]] = {}
+        for i, entity in enumerate(entities):
+            variants.setdefault(entity.casefold(), []).append(i)
+
+        if len(variants) <= self.topk:
+            return [list(range(len(entities))) for _ in nouns]
+
+        if len(nouns) == 0:
+            return []
+
+        distinct = [entities[indices[0]] for indices in variants.values()]
+        groups = list(variants.values())
+
+        missing = [e for e in distinct if e not in self.entity_vectors]
+        if len(missing) != 0:
+            self.entity_vectors.update(zip(missing, self._encode(missing)))
+
+        noun_vectors = self._vectorize(nouns)
+        entity_vectors = np.stack([self.entity_vectors[e] for e in distinct])
+        similarities = noun_vectors @ entity_vectors.T
+
+        topk = np.argpartition(-similarities, self.topk - 1, axis=1)[:, :self.topk]
+        order = np.argsort(-np.take_along_axis(similarities, topk, axis=1), axis=1, kind="stable")
+        return [
+            [i for group in row for i in groups[group]]
+            for row in np.take_along_axis(topk, order, axis=1).tolist()
+        ]
+
+    def _vectorize(self, texts: List[str]) -> np.ndarray:
+        cached = self.cache.get_many(self.model_name, texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+
+        if len(missing) != 0:
+            encoded = self._encode(missing)
+            self.cache.put_many(self.model_name, missing, encoded)
+            vectors = dict(zip(missing, encoded))
+            cached = [v if v is not None else vectors[t] for t, v in zip(texts, cached)]
+
+        return np.stack(cached)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.array(self.encoder.encode(texts, batch_size=self.batch_size), dtype=np.float32)
+        vectors = vectors.reshape(len(texts), -1)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
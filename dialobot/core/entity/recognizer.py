@@ -14,21 +14,72 @@
 
 import os
 import contextlib
-import nltk
-from nltk.tokenize import word_tokenize
 import torch
 from torch.nn import functional as F
-from pynori.korean_analyzer import KoreanAnalyzer
-from jieba import posseg as pseg
-from typing import Union, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Dict, Any, Iterable, Iterator, List, Optional, Tuple
 from dialobot.core.base import NerBase
+from dialobot.core.entity import analyzer
+from dialobot.core.entity.gazetteer import Gazetteer
+from dialobot.core.entity.prefilter import EntityPrefilter
+from dialobot.core.entity.memo import EntityMemo
 from dialobot.core.utils import LANGUAGE_ALIAS, BrainBertTokenizer
-from transformers import BertTokenizer, RobertaTokenizer, RobertaForSequenceClassification
+from dialobot.core.utils.model import load_nli_model, nli_probs
+from dialobot.core.utils.scheduler import MicroBatchScheduler
+from dialobot.core.utils.batcher import AsyncBatcher
+from transformers import BertTokenizer, RobertaTokenizer
 
 
 class Ner(NerBase):
 
-    def __init__(self, lang: str, merge=True, device="cpu") -> None:
+    def __init__(
+        self,
+        lang: str,
+        merge=True,
+        device="cpu",
+        max_batch: Optional[int] = None,
+        precision: str = "fp32",
+        backend: str = "torch",
+        batching: Optional[Dict[str, Any]] = None,
+        gazetteer: Optional[Gazetteer] = None,
+        prefilter: Optional[EntityPrefilter] = None,
+        memo: Optional[EntityMemo] = None,
+        download: bool = True,
+    ) -> None:
+        """
+        Zero-shot named entity recognizer using RoBERTa NLI models.
+
+        Args:
+            lang (str): language
+            merge (bool): whether to merge adjacent tokens of the same entity or not
+            device (str): device to run models
+            max_batch (Optional[int]): maximum number of (noun, entity) pairs in a forward pass.
+                every pair of a sentence is scored in a single forward pass if it is None.
+            precision (str): precision of model, one of ['fp32', 'int8-dynamic', 'bf16'].
+                (see `load_nli_model`)
+            backend (str): inference backend, one of ['torch', 'onnx']
+            batching (Optional[Dict[str, Any]]): arguments of `MicroBatchScheduler`
+                to score hypothesises of concurrent requests together, e.g. {"max_batch": 64, "max_wait": 5}.
+                each request is scored by itself if it is None.
+            gazetteer (Optional[Gazetteer]): registered words of entities. tokens inside of
+                registered words of requested entities are recognized with score 1.0 without NLI.
+            prefilter (Optional[EntityPrefilter]): sentence embedding filter which selects
+                candidate entities of each noun to score with NLI. every entity is scored if it is None.
+            memo (Optional[EntityMemo]): memo of entities of nouns keyed by the list of entities.
+                nouns are scored every time if it is None.
+            download (bool): whether to download NLTK resources for English
+                if they are not found locally. an exception is raised for missing resources if it is False.
+
+        Note:
+            Morphological analyzers are built once per process and shared by threads.
+            (see `dialobot.core.entity.analyzer`)
+
+        Examples:
+            >>> ner = Ner(lang="en")
+            >>> ner.warmup()
+            >>> ner.recognize("I live in Seoul", entities=["city"])
+        """
+
         lang = lang.lower()
 
         if lang not in self.available_languages():
@@ -39,8 +90,6 @@ class Ner(NerBase):
             "So, param `lang` must be one of ['en', 'ko', 'zh]"
 
         if lang == "en":
-            nltk.download('punkt')
-            nltk.download('averaged_perceptron_tagger')
             self.model_name = "hyunwoongko/roberta-base-en-mnli"
             self.tokenizer = RobertaTokenizer.from_pretrained(self.model_name)
 
@@ -81,7 +130,49 @@ class Ner(NerBase):
         self.lang = lang
         self.merge = merge
         self.device = device
-        self.model = RobertaForSequenceClassification.from_pretrained(self.model_name).to(self.device)
+        self.max_batch = max_batch
+        self.gazetteer = gazetteer
+        self.prefilter = prefilter
+        self.memo = memo
+        self.batcher: Optional[AsyncBatcher] = None
+        self.model = load_nli_model(
+            self.model_name,
+            device=self.device,
+            precision=precision,
+            backend=backend,
+        )
+        self.scheduler: Optional[MicroBatchScheduler] = None
+        if batching is not None:
+            self.scheduler = MicroBatchScheduler(
+                lambda items: list(self._entailment(items)),
+                name="dialobot-ner-scheduler",
+                **batching,
+            )
+
+        if download and lang == "en":
+            analyzer.download()
+
+        # built once per process and shared by every Ner of the language.
+        analyzer.load(lang)
+
+    def warmup(self) -> None:
+        """
+        Run a request once, so the first request does not pay for
+        lazy initialization of tokenizer and model.
+
+        Examples:
+            >>> ner = Ner(lang="en")
+            >>> ner.warmup()
+        """
+
+        sentences = {
+            "en": ("I live in Seoul", ["city"]),
+            "ko": ("서울에 살아요", ["도시"]),
+            "zh": ("我住在首尔", ["城市"]),
+        }
+
+        text, entities = sentences[self.lang]
+        self.recognize(text, entities)
 
     @staticmethod
     def available_languages():
@@ -97,47 +188,125 @@ class Ner(NerBase):
         return templates[lang]
 
     def recognize(self, text: str, entities: List, threshold: float =0.825) -> Union[str, List[str], float]:
+        tokens, nouns = analyzer.analyze(self.lang, text)
+        entities = self._entities(entities)
+
+        # only nouns not covered by registered words are sent to NLI.
+        covered = self._cover(text, tokens, entities)
+        ner_dict = self.classify([n for n in nouns if n not in covered], entities)
+        ner_dict.update(covered)
+
+        return self._output(tokens, ner_dict, threshold)
+
+    def recognize_batch(
+        self,
+        texts: List[str],
+        entities: List,
+        threshold: float = 0.825,
+        num_workers: int = 4,
+    ) -> List[Union[str, List[str], float]]:
+        """
+        Recognize entities of sentences at once.
+        Sentences are analyzed on a thread pool, and each noun of the whole batch
+        is scored only once. (and never again with `memo`)
+
+        Args:
+            texts (List[str]): input sentences
+            entities (List): List of entities
+            threshold (float): minimum score of entity
+            num_workers (int): number of threads to analyze sentences
+
+        Returns:
+            (List[Union[str, List[str], float]]): output of `recognize` of each sentence
+
+        Examples:
+            >>> ner = Ner(lang="en", memo=EntityMemo(path="~/.dialobot/entity/memo.db"))
+            >>> ner.recognize_batch(["please order pizza", "I live in Seoul"], entities=["FOOD", "CITY"])
+        """
+
+        texts = list(texts)
+        entities = self._entities(entities)
+
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+            analyzed = list(executor.map(lambda text: analyzer.analyze(self.lang, text), texts))
+
+        covered = [self._cover(text, tokens, entities) for text, (tokens, _) in zip(texts, analyzed)]
+        ner_dict = self.classify(
+            [n for (_, nouns), c in zip(analyzed, covered) for n in nouns if n not in c],
+            entities,
+        )
+
+        outputs = []
+        for (tokens, nouns), c in zip(analyzed, covered):
+            line_dict = {n: ner_dict[n] for n in nouns if n not in c}
+            line_dict.update(c)
+            outputs.append(self._output(tokens, line_dict, threshold))
+
+        return outputs
+
+    def recognize_iter(
+        self,
+        texts: Iterable[str],
+        entities: List,
+        threshold: float = 0.825,
+        batch_size: int = 256,
+        num_workers: int = 4,
+    ) -> Iterator[Union[str, List[str], float]]:
+        """
+        Streaming version of `recognize_batch` for a large corpus.
+        Sentences are read lazily and recognized in batches of `batch_size`.
+
+        Args:
+            texts (Iterable[str]): input sentences, e.g. lines of a file
+            entities (List): List of entities
+            threshold (float): minimum score of entity
+            batch_size (int): number of sentences in a batch
+            num_workers (int): number of threads to analyze sentences
+
+        Returns:
+            (Iterator[Union[str, List[str], float]]): output of `recognize` of each sentence in order
+
+        Examples:
+            >>> with open("chat.log") as fp:
+            ...     for output in ner.recognize_iter(fp, entities=["FOOD", "CITY"]):
+            ...         print(output)
+        """
+
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) == batch_size:
+                yield from self.recognize_batch(batch, entities, threshold, num_workers)
+                batch = []
+
+        if len(batch) != 0:
+            yield from self.recognize_batch(batch, entities, threshold, num_workers)
+
+    def _entities(self, entities: List) -> List[str]:
+        entities = list(entities)
         if self.lang == "en":
-            tokens = word_tokenize(text)
-            nouns = [w for w, p in nltk.pos_tag(tokens) if "NN" in p]
             entities += [e.lower() for e in entities]
             entities += [e.capitalize() for e in entities]
             entities = list(set(entities))
 
-        elif self.lang == "ko":
-            nori = KoreanAnalyzer(decompound_mode='None',
-                                  infl_decompound_mode='DISCARD',
-                                  discard_punctuation=True,
-                                  output_unknown_unigrams=False,
-                                  pos_filter=False,
-                                  synonym_filter=False)
-            nori_tokenize = nori.do_analysis(text)
-            tokens = nori_tokenize['termAtt']
-            nouns = [w for w, p in zip(nori_tokenize['termAtt'], nori_tokenize['posTagAtt']) if "NN" in p]
-
-        elif self.lang == "zh":
-            pos_tag = pseg.lcut(text)
-            tokens = [w for w, p in pos_tag]
-            nouns = [w for w, p in pos_tag if "n" in p]
-
-        ner_output, ner_dict = [], {}
-        for n in nouns:
-            scores = []
-            for e in entities:
-                text = self.hypothesises(lang=self.lang, noun=n, entity=e)
-                nli_input = self.tokenizer(text, return_tensors="pt")
-                if self.lang == "ko":
-                    attention_mask = torch.tensor([1 for _ in range(len(nli_input[0]))]).unsqueeze(0).long()
-                    nli_input = {'input_ids': nli_input, 'attention_mask': attention_mask}
-                output = self.model(**nli_input).logits[0]
-                output = torch.softmax(output, dim=0)[1]
-                scores.append(output.unsqueeze(0))
-
-            output = F.softmax(torch.cat(scores, dim=0))
-            argmax = output.argmax(-1)
-            result = entities[argmax]
-            ner_dict[n] = (result, scores[argmax])
+        return entities
 
+    def _cover(self, text: str, tokens: List[str], entities: List[str]) -> Dict[str, Tuple[str, torch.Tensor]]:
+        if self.gazetteer is None:
+            return {}
+
+        return {
+            token: (entity, torch.tensor(1.0))
+            for token, entity in self.gazetteer.cover(text, tokens, entities).items()
+        }
+
+    def _output(
+        self,
+        tokens: List[str],
+        ner_dict: Dict[str, Tuple[str, torch.Tensor]],
+        threshold: float,
+    ) -> Union[str, List[str], float]:
+        ner_output = []
         for token in tokens:
             if token in ner_dict:
                 score = round(ner_dict[token][1].item(), 3)
@@ -191,6 +360,160 @@ class Ner(NerBase):
 
         return ner_output
 
+    def classify(
+        self,
+        nouns: List[str],
+        entities: List[str],
+    ) -> Dict[str, Tuple[str, torch.Tensor]]:
+        """
+        Classify nouns into entities.
+        (noun, entity) pairs of every noun are padded and scored together,
+        in forward passes of `max_batch` pairs. (see `nli_probs`)
+        With `prefilter`, only candidate entities of each noun are scored.
+        With `memo`, nouns scored before with the same entities and `topk` of prefilter are not scored again.
+
+        Args:
+            nouns (List[str]): nouns of input sentence
+            entities (List[str]): List of entities
+
+        Returns:
+            (Dict[str, Tuple[str, torch.Tensor]]): entity of each noun and its entailment probability
+        """
+
+        nouns = list(dict.fromkeys(nouns))
+        if self.memo is None:
+            return self._classify(nouns, entities)
+
+        topk = self.prefilter.topk if self.prefilter is not None else None
+        results = {}
+        for noun, memoized in zip(nouns, self.memo.get_many(self.model_name, entities, nouns, topk)):
+            if memoized is not None:
+                results[noun] = (memoized[0], torch.tensor(memoized[1]))
+
+        scored = self._classify([n for n in nouns if n not in results], entities)
+        self.memo.put_many(self.model_name, entities, {n: (e, s.item()) for n, (e, s) in scored.items()}, topk)
+        results.update(scored)
+        return results
+
+    def _classify(self, nouns: List[str], entities: List[str]) -> Dict[str, Tuple[str, torch.Tensor]]:
+        if len(nouns) == 0:
+            return {}
+
+        if self.prefilter is not None:
+            candidates = self.prefilter.candidates(nouns, entities)
+        else:
+            candidates = [list(range(len(entities))) for _ in nouns]
+
+        rows = [row for row, indices in enumerate(candidates) for _ in indices]
+        columns = [i for indices in candidates for i in indices]
+        input_ids = [
+            self.encode(self.hypothesises(lang=self.lang, noun=nouns[row], entity=entities[i]))
+            for row, i in zip(rows, columns)
+        ]
+
+        # entities pruned by `prefilter` are excluded from softmax and argmax.
+        scores = torch.full((len(nouns), len(entities)), float("-inf"))
+        scores[rows, columns] = self.entailment(input_ids)
+        argmax = F.softmax(scores, dim=-1).argmax(-1)
+
+        return {
+            n: (entities[i], scores[row, i])
+            for row, (n, i) in enumerate(zip(nouns, argmax.tolist()))
+        }
+
+    def encode(self, text: str) -> List[int]:
+        """
+        Args:
+            text (str): input text
+
+        Returns:
+            (List[int]): token ids with special tokens
+        """
+
+        if self.lang == "ko":
+            return self.tokenizer(text, return_tensors=None)
+
+        return self.tokenizer(text)["input_ids"]
+
+    def entailment(self, input_ids: List[List[int]]) -> torch.Tensor:
+        """
+        Compute entailment probabilities of (noun, entity) hypothesises.
+        With `batching`, hypothesises of concurrent requests are scored together.
+
+        Args:
+            input_ids (List[List[int]]): token ids of hypothesises
+
+        Returns:
+            (torch.Tensor): entailment probability of each hypothesis, shape of (number of hypothesises, )
+        """
+
+        if self.scheduler is None or len(input_ids) == 0:
+            return self._entailment(input_ids)
+
+        return torch.stack(self.scheduler.map(input_ids))
+
+    def _entailment(self, input_ids: List[List[int]]) -> torch.Tensor:
+        return nli_probs(self.model, input_ids, self.device, self.max_batch)[:, 1]
+
+    async def arecognize(
+        self,
+        text: str,
+        entities: List,
+        threshold: float = 0.825,
+    ) -> Union[str, List[str], float]:
+        """
+        Coroutine version of `recognize` which does not block the event loop.
+        Model runs on a thread pool of Ner, and concurrent callers are
+        coalesced into batches. (see `AsyncBatcher`)
+        Cancelled callers are dropped before their batch runs.
+
+        Examples:
+            >>> ner = Ner(lang="en")
+            >>> await ner.arecognize("I live in Seoul", entities=["city"])
+        """
+
+        if self.batcher is None:
+            self.batcher = AsyncBatcher(self._recognize_items)
+
+        return await self.batcher.submit((text, tuple(entities), threshold))
+
+    def _recognize_items(self, items: List[Tuple[str, Tuple, float]]) -> List[Any]:
+        """
+        Recognize items of `arecognize`, items with the same entities and threshold
+        are recognized together. (see `recognize_batch`)
+        """
+
+        groups: Dict[Tuple, List[int]] = {}
+        for i, (_, entities, threshold) in enumerate(items):
+            groups.setdefault((entities, threshold), []).append(i)
+
+        results: List[Any] = [None] * len(items)
+        for (entities, threshold), indices in groups.items():
+            try:
+                outputs = self.recognize_batch(
+                    [items[i][0] for i in indices],
+                    list(entities),
+                    threshold,
+                )
+            except Exception as e:
+                outputs = [e] * len(indices)
+
+            for i, output in zip(indices, outputs):
+                results[i] = output
+
+        return results
+
+    def close(self) -> None:
+        """
+        Shut down the thread pool of `arecognize` and the scheduler.
+        """
+
+        if self.batcher is not None:
+            self.batcher.close()
+
+        if self.scheduler is not None:
+            self.scheduler.close()
+
     def download_brainbert_tokenizer(
         self,
         dir_path: str,
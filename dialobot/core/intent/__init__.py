@@ -14,6 +14,7 @@
 
 from dialobot.core.intent.classifier import IntentClassifier
 from dialobot.core.intent.retriever import IntentRetriever
+from dialobot.core.intent.index import IndexPolicy
 from dialobot.core.intent.pipeline import Intent
 
-__all__ = [IntentRetriever, IntentClassifier, Intent]
+__all__ = [IntentRetriever, IntentClassifier, Intent, IndexPolicy]
@@ -16,11 +16,12 @@ import os
 import contextlib
 import torch
 
-from typing import Union, Dict, Any, List
+from typing import Union, Dict, Any, List, Optional, Tuple
 from dialobot.core.base import IntentBase
 from dialobot.core.utils import LANGUAGE_ALIAS, BrainBertTokenizer
+from dialobot.core.utils.model import load_nli_model, nli_probs
+from dialobot.core.utils.scheduler import MicroBatchScheduler
 from transformers import (
-    RobertaForSequenceClassification,
     RobertaTokenizer,
     BertTokenizer,
     BertJapaneseTokenizer,
@@ -33,12 +34,29 @@ class IntentClassifier(IntentBase):
         self,
         lang: str,
         device="cpu",
+        max_batch: Optional[int] = None,
+        precision: str = "fp32",
+        backend: str = "torch",
+        batching: Optional[Dict[str, Any]] = None,
+        num_threads: Optional[int] = None,
     ) -> None:
         """
         Zero-shot intent classifier using RoBERTa models.
 
         Args:
             lang (str): language
+            device (str): device to run models
+            max_batch (Optional[int]): maximum number of (sentence, intent) pairs in a forward pass.
+                every pair of a request is scored in a single forward pass if it is None.
+            precision (str): precision of model, one of ['fp32', 'int8-dynamic', 'bf16'].
+                (see `load_nli_model`)
+            backend (str): inference backend, one of ['torch', 'onnx']
+            batching (Optional[Dict[str, Any]]): arguments of `MicroBatchScheduler`
+                to score pairs of concurrent requests together, e.g. {"max_batch": 64, "max_wait": 5}.
+                each request is scored by itself if it is None.
+            num_threads (Optional[int]): number of intra-op threads of onnx backend.
+                default of ONNX Runtime is used if it is None.
+
         Examples:
             >>> # 1. create classifier
             >>> clf = IntentClassifier(lang="en")
@@ -107,8 +125,32 @@ class IntentClassifier(IntentBase):
 
         self.lang = lang
         self.device = device
-        self.model = RobertaForSequenceClassification.from_pretrained(
-            self.model_name).to(self.device)
+        self.max_batch = max_batch
+
+        if lang == "ko":
+            self.cls_token_id = self.tokenizer.token_to_id("<s>")
+            self.sep_token_id = self.tokenizer.token_to_id("</s>")
+        else:
+            self.cls_token_id = self.tokenizer.cls_token_id
+            self.sep_token_id = self.tokenizer.sep_token_id
+
+        # (lang, intent) -> token ids of hypothesis for intents of the last request
+        self.hypothesis_cache: Dict[Tuple[str, str], List[int]] = {}
+        self.cached_intents: Tuple[str, ...] = ()
+        self.model = load_nli_model(
+            self.model_name,
+            device=self.device,
+            precision=precision,
+            backend=backend,
+            num_threads=num_threads,
+        )
+        self.scheduler: Optional[MicroBatchScheduler] = None
+        if batching is not None:
+            self.scheduler = MicroBatchScheduler(
+                lambda items: list(self._forward(items)),
+                name="dialobot-clf-scheduler",
+                **batching,
+            )
 
     @staticmethod
     def available_languages():
@@ -142,28 +184,65 @@ class IntentClassifier(IntentBase):
             (str): intent of input sentence (detail=False)
             (Dict[str, Union[str, List[Tuple[float, str]]]]): intent and distances (detail=True)
 
+        Note:
+            (sentence, hypothesis of intent) pairs of every intent are padded
+            and scored in a single forward pass. (see `entailment`)
+            Sentence is tokenized once and spliced with cached token ids of hypothesises.
+
         """
-        results = []
-        for intent in intents:
-            hypothesis = self.hypothesises(self.lang, intent)
-            text = f"{text}</s></s>{hypothesis}"
-            tokens = self.tokenizer(text, return_tensors="pt")
-            tokens = tokens.to(self.device)
+        return self._output(intents, self.entailment(text, intents).tolist(), detail)
+
+    def recognize_batch(
+        self,
+        texts: List[str],
+        intents: List[str],
+        detail: bool = False,
+    ) -> List[Union[str, Dict[str, Any]]]:
+        """
+        Recognize intents of many sentences at once.
+        Pairs of every sentence and intent are scored together in forward passes
+        of `max_batch` pairs, and hypothesises are tokenized only once.
+
+        Args:
+            texts (List[str]): input sentences
+            intents (List[str]): List of intents
+            detail (bool): whether to return details or not
+
+        Returns:
+            (List[Union[str, Dict[str, Any]]]): output of `recognize` of each sentence
 
-            if self.lang != "ko":
-                tokens = tokens["input_ids"]
+        Examples:
+            >>> clf = IntentClassifier(lang="en")
+            >>> clf.recognize_batch(["Tell me today's weather", "I'm hungry"], intents=["weather", "restaurant"])
+            ['weather', 'restaurant']
+        """
+
+        if len(texts) == 0:
+            return []
+
+        hypothesis_ids = self.hypothesis_ids(intents)
+        input_ids = [
+            pair
+            for text in texts
+            for pair in self._pairs(text, hypothesis_ids)
+        ]
 
-            output = self.model(tokens).logits[0]
-            output = torch.softmax(output, dim=0)
-            results.append(output[self.labels()])
+        results = self.forward(input_ids).view(len(texts), len(intents)).tolist()
+        return [self._output(intents, r, detail) for r in results]
 
+    def _output(
+        self,
+        intents: List[str],
+        results: List[float],
+        detail: bool,
+    ) -> Union[str, Dict[str, Any]]:
         f = lambda i: results[i]
         argmax = max(range(len(results)), key=f)
 
         if not detail:
             return intents[argmax]
 
-        detail_dict = {k: round(v.item(), 5) for k, v in zip(intents, results)}
+        detail_dict = {k: round(v, 5) for k, v in zip(intents, results)}
 
         return {
             "intent": intents[argmax],
@@ -176,6 +255,94 @@ class IntentClassifier(IntentBase):
             }
         }
 
+    def entailment(self, text: str, intents: List[str]) -> torch.Tensor:
+        """
+        Compute entailment probabilities of hypothesises of intents.
+
+        Args:
+            text (str): input sentence
+            intents (List[str]): List of intents
+
+        Returns:
+            (torch.Tensor): entailment probability of each intent, shape of (number of intents, )
+        """
+
+        return self.forward(self._pairs(text, self.hypothesis_ids(intents)))
+
+    def _pairs(self, text: str, hypothesis_ids: List[List[int]]) -> List[List[int]]:
+        # <s> sentence </s></s> hypothesis </s>
+        premise = [self.cls_token_id] + self.encode(text) + [self.sep_token_id] * 2
+        return [
+            premise + hypothesis + [self.sep_token_id]
+            for hypothesis in hypothesis_ids
+        ]
+
+    def hypothesis_ids(self, intents: List[str]) -> List[List[int]]:
+        """
+        Token ids of hypothesises are cached per (lang, intent),
+        and the cache is invalidated when the list of intents changes.
+
+        Args:
+            intents (List[str]): List of intents
+
+        Returns:
+            (List[List[int]]): token ids of hypothesis of each intent without special tokens
+        """
+
+        cache = self.hypothesis_cache
+        if tuple(intents) != self.cached_intents:
+            cache = {
+                (self.lang, intent): cache[(self.lang, intent)]
+                for intent in intents
+                if (self.lang, intent) in cache
+            }
+
+        for intent in intents:
+            if (self.lang, intent) not in cache:
+                cache[(self.lang, intent)] = self.encode(
+                    self.hypothesises(self.lang, intent))
+
+        # replaced at once not to break concurrent requests
+        self.hypothesis_cache, self.cached_intents = cache, tuple(intents)
+        return [cache[(self.lang, intent)] for intent in intents]
+
+    def encode(self, text: str) -> List[int]:
+        """
+        Args:
+            text (str): input text
+
+        Returns:
+            (List[int]): token ids without special tokens
+        """
+
+        if self.lang == "ko":
+            return self.tokenizer(text, return_tensors=None, add_special_tokens=False)
+
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def forward(self, input_ids: List[List[int]]) -> torch.Tensor:
+        """
+        Score token ids of (sentence, hypothesis) pairs in padded batches.
+        Pairs are sorted by length and split into batches of `max_batch`,
+        so pairs of similar length are padded together. (see `nli_probs`)
+        With `batching`, pairs of concurrent requests are scored together.
+
+        Args:
+            input_ids (List[List[int]]): token ids of pairs
+
+        Returns:
+            (torch.Tensor): entailment probability of each pair, shape of (number of pairs, )
+        """
+
+        if self.scheduler is None or len(input_ids) == 0:
+            return self._forward(input_ids)
+
+        return torch.stack(self.scheduler.map(input_ids))
+
+    def _forward(self, input_ids: List[List[int]]) -> torch.Tensor:
+        probs = nli_probs(self.model, input_ids, self.device, self.max_batch)
+        return probs[:, self.labels()]
+
     def labels(self):
         if "xnli" in self.model_name:
             return 0
@@ -0,0 +1,432 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+COLUMNS = ["ids", "vectors", "intents", "offsets", "sentences"]
+
+
+class IntentDataset:
+
+    def __init__(self, dim: int, dtype: np.dtype = np.float32) -> None:
+        """
+        Columnar dataset of IntentRetriever.
+
+        Data loaded from disk are kept as columns which can be memory-mapped
+        with `np.load(mmap_mode='r')`, and they are never modified in place.
+
+        - ids (int64, [n]): sorted ids of index
+        - vectors (float32 or float16, [n, dim]): contiguous vector matrix
+        - intents (int32, [n]): intent codes for `labels`
+        - offsets (int64, [n + 1]) and sentences (uint8): utf-8 encoded sentences
+
+        Data added after loading are kept in a small dictionary,
+        and removed data are marked in a boolean mask.
+        Both are merged into columns when the dataset is saved,
+        and the saved columns replace them with `rebase`.
+
+        Args:
+            dim (int): dimension of vectors
+            dtype (np.dtype): data type to store vectors. float32 or float16
+
+        Examples:
+            >>> dataset = IntentDataset(dim=384)
+            >>> dataset[0] = ("What time is it now?", vector, "time")
+            >>> dataset[0]
+            ("What time is it now?", vector, "time")
+            >>> dataset.save("~/.dialobot/intent/dataset.1")
+            >>> dataset = IntentDataset.load("~/.dialobot/intent/dataset.1")
+        """
+
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.labels: List[str] = []
+        self.codes: Dict[str, int] = {}
+        # intent -> number of data, updated on every mutation
+        self.counts: Dict[str, int] = {}
+
+        self.ids = np.empty((0,), dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=self.dtype)
+        self.intents = np.empty((0,), dtype=np.int32)
+        self.offsets = np.zeros((1,), dtype=np.int64)
+        self.sentences = np.empty((0,), dtype=np.uint8)
+        self.alive = np.empty((0,), dtype=bool)
+        self.num_alive = 0
+
+        # id -> (sentence, vector, intent code) of data added after loading
+        self.delta: Dict[int, Tuple[str, np.ndarray, int]] = {}
+
+    @staticmethod
+    def from_rows(
+        rows: Dict[int, Tuple[str, np.ndarray, str]],
+        dim: int,
+        dtype: np.dtype = np.float32,
+    ) -> "IntentDataset":
+        """
+        Create dataset from rows of previous versions.
+
+        Args:
+            rows (Dict[int, Tuple[str, np.ndarray, str]]): id -> (sentence, vector, intent)
+            dim (int): dimension of vectors
+            dtype (np.dtype): data type to store vectors. float32 or float16
+
+        Returns:
+            (IntentDataset): dataset
+        """
+
+        dataset = IntentDataset(dim, dtype)
+        for _id, row in rows.items():
+            dataset[_id] = row
+
+        return dataset
+
+    @staticmethod
+    def load(prefix: str, mmap: bool = True) -> Optional["IntentDataset"]:
+        """
+        Load dataset saved by `save`.
+
+        Args:
+            prefix (str): path prefix of column files
+            mmap (bool): whether to memory-map columns or not
+
+        Returns:
+            (Optional[IntentDataset]): dataset, None if it does not exist
+        """
+
+        if not os.path.exists(f"{prefix}.labels.json"):
+            return None
+
+        mmap_mode = "r" if mmap else None
+        columns = {
+            c: np.load(f"{prefix}.{c}.npy", mmap_mode=mmap_mode)
+            for c in COLUMNS
+        }
+
+        dataset = IntentDataset(columns["vectors"].shape[1], columns["vectors"].dtype)
+        for c in COLUMNS:
+            setattr(dataset, c, columns[c])
+
+        with open(f"{prefix}.labels.json", encoding="utf-8") as f:
+            dataset.labels = json.load(f)
+
+        dataset.codes = {label: i for i, label in enumerate(dataset.labels)}
+        dataset.counts = {
+            dataset.labels[code]: int(count)
+            for code, count in enumerate(np.bincount(dataset.intents, minlength=len(dataset.labels)))
+            if count != 0
+        }
+        dataset.alive = np.ones((len(dataset.ids),), dtype=bool)
+        dataset.num_alive = len(dataset.ids)
+        return dataset
+
+    @staticmethod
+    def files(prefix: str) -> List[str]:
+        """
+        Args:
+            prefix (str): path prefix of column files
+
+        Returns:
+            (List[str]): files written by `save`
+        """
+
+        return [f"{prefix}.{c}.npy" for c in COLUMNS] + [f"{prefix}.labels.json"]
+
+    def save(self, prefix: str) -> None:
+        """
+        Merge removed and added data into columns, and write them.
+
+        Args:
+            prefix (str): path prefix of column files
+        """
+
+        delta_ids = np.array(sorted(self.delta), dtype=np.int64)
+        delta = [self.delta[int(_id)] for _id in delta_ids]
+        encoded = [sentence.encode("utf-8") for sentence, _, _ in delta]
+
+        lengths = np.diff(self.offsets)
+        if self.num_alive == len(self.ids):
+            sentences = self.sentences
+        else:
+            rows = np.repeat(np.arange(len(lengths)), lengths)
+            sentences = self.sentences[self.alive[rows]]
+
+        lengths = np.concatenate([
+            lengths[self.alive],
+            np.array([len(e) for e in encoded], dtype=np.int64),
+        ])
+
+        columns = {
+            "ids": np.concatenate([self.ids[self.alive], delta_ids]),
+            "vectors": np.concatenate(
+                [self.vectors[self.alive]] + [vector for _, vector, _ in delta],
+                axis=0,
+            ).astype(self.dtype, copy=False),
+            "intents": np.concatenate([
+                self.intents[self.alive],
+                np.array([code for _, _, code in delta], dtype=np.int32),
+            ]),
+            "offsets": np.concatenate([
+                np.zeros((1,), dtype=np.int64),
+                np.cumsum(lengths, dtype=np.int64),
+            ]),
+            "sentences": np.concatenate([
+                sentences,
+                np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            ]),
+        }
+
+        for c in COLUMNS:
+            with open(f"{prefix}.{c}.npy", mode="wb") as f:
+                np.save(f, columns[c])
+                f.flush()
+                os.fsync(f.fileno())
+
+        with open(f"{prefix}.labels.json", mode="w", encoding="utf-8") as f:
+            json.dump(self.labels, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def rebase(self, snapshot: "IntentDataset", saved: "IntentDataset") -> bool:
+        """
+        Replace columns with `saved`, which was written from `snapshot` of this dataset.
+        Data which were in `snapshot` are read from the new columns and removed from `delta`,
+        so added data do not stay in `delta` after they are saved.
+        Mutations since the snapshot are kept in `alive` and `delta`.
+
+        Args:
+            snapshot (IntentDataset): snapshot of this dataset returned by `snapshot`
+            saved (IntentDataset): dataset loaded from the files which `snapshot` saved
+
+        Returns:
+            (bool): whether columns are replaced or not.
+                they are not replaced if columns have been replaced since the snapshot. (e.g. `clear`)
+        """
+
+        if self.ids is not snapshot.ids or self.vectors is not snapshot.vectors:
+            return False
+
+        # saved rows are alive rows of the snapshot columns, and then data of the snapshot delta.
+        alive = np.empty((len(saved.ids),), dtype=bool)
+        alive[:snapshot.num_alive] = self.alive[snapshot.alive]
+        alive[snapshot.num_alive:] = [
+            self.delta.get(int(_id)) is snapshot.delta[int(_id)]
+            for _id in saved.ids[snapshot.num_alive:]
+        ]
+
+        for c in COLUMNS:
+            setattr(self, c, getattr(saved, c))
+
+        self.delta = {
+            _id: row for _id, row in self.delta.items()
+            if snapshot.delta.get(_id) is not row
+        }
+        self.alive = alive
+        self.num_alive = int(alive.sum())
+        return True
+
+    def snapshot(self) -> "IntentDataset":
+        """
+        Returns:
+            (IntentDataset): copy of dataset which is not affected by later mutations.
+                columns are shared because they are never modified in place.
+        """
+
+        dataset = IntentDataset(self.dim, self.dtype)
+        dataset.__dict__.update(self.__dict__)
+        dataset.labels = list(self.labels)
+        dataset.codes = dict(self.codes)
+        dataset.counts = dict(self.counts)
+        dataset.alive = self.alive.copy()
+        dataset.delta = dict(self.delta)
+        return dataset
+
+    def code(self, intent: str) -> int:
+        """
+        Args:
+            intent (str): intent
+
+        Returns:
+            (int): code of intent, new code is assigned to unseen intent
+        """
+
+        if intent not in self.codes:
+            self.codes[intent] = len(self.labels)
+            self.labels.append(intent)
+
+        return self.codes[intent]
+
+    def intent_codes(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            ids (np.ndarray): ids of index
+
+        Returns:
+            (np.ndarray): intent codes of ids
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        codes = np.empty(ids.shape, dtype=np.int32)
+        positions = np.searchsorted(self.ids, ids)
+        positions = np.minimum(positions, max(len(self.ids) - 1, 0))
+        in_base = (self.ids[positions] == ids) if len(self.ids) else np.zeros(ids.shape, bool)
+
+        codes[in_base] = self.intents[positions[in_base]]
+        for i in np.flatnonzero(~in_base):
+            codes.flat[i] = self.delta[int(ids.flat[i])][2]
+
+        return codes
+
+    def vectors_of(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            ids (np.ndarray): ids of index, -1 for missing data
+
+        Returns:
+            (np.ndarray): float32 vectors of ids, shape of (number of ids, dim).
+                vectors of missing data are zero.
+        """
+
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.zeros((len(ids), self.dim), dtype=np.float32)
+        if len(ids) == 0:
+            return vectors
+
+        positions = np.searchsorted(self.ids, ids)
+        positions = np.minimum(positions, max(len(self.ids) - 1, 0))
+        in_base = (self.ids[positions] == ids) if len(self.ids) else np.zeros(ids.shape, bool)
+        in_base &= ids != -1
+
+        vectors[in_base] = self.vectors[positions[in_base]]
+        for i in np.flatnonzero(~in_base & (ids != -1)):
+            vectors[i] = self.delta[int(ids[i])][1][0]
+
+        return vectors
+
+    def matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (np.ndarray): ids of every data
+            (np.ndarray): vectors of every data, shape of (number of data, dim)
+        """
+
+        delta_ids = np.fromiter(self.delta.keys(), dtype=np.int64, count=len(self.delta))
+        ids = np.concatenate([self.ids[self.alive], delta_ids])
+        vectors = np.concatenate(
+            [self.vectors[self.alive]] + [vector for _, vector, _ in self.delta.values()],
+            axis=0,
+        ).astype(np.float32, copy=False)
+        return ids, vectors
+
+    def unique_intents(self) -> List[str]:
+        """
+        Returns:
+            (List[str]): intents of every data
+        """
+
+        return list(self.counts)
+
+    def max_id(self) -> int:
+        """
+        Returns:
+            (int): maximum id in dataset, -1 if dataset is empty
+        """
+
+        max_id = int(self.ids[-1]) if len(self.ids) != 0 else -1
+        return max([max_id] + list(self.delta.keys()))
+
+    def pop(self, _id: int) -> Tuple[str, np.ndarray, str]:
+        """
+        Remove data of id.
+
+        Args:
+            _id (int): id of index
+
+        Returns:
+            (Tuple[str, np.ndarray, str]): removed (sentence, vector, intent)
+        """
+
+        row = self[_id]
+        self._count(row[2], -1)
+        if _id in self.delta:
+            del self.delta[_id]
+        else:
+            self.alive[self._position(_id)] = False
+            self.num_alive -= 1
+
+        return row
+
+    def items(self) -> Iterator[Tuple[int, Tuple[str, np.ndarray, str]]]:
+        for p in np.flatnonzero(self.alive):
+            yield int(self.ids[p]), self._row(p)
+
+        for _id, (sentence, vector, code) in list(self.delta.items()):
+            yield _id, (sentence, vector, self.labels[code])
+
+    def values(self) -> Iterator[Tuple[str, np.ndarray, str]]:
+        for _, row in self.items():
+            yield row
+
+    def __getitem__(self, _id: int) -> Tuple[str, np.ndarray, str]:
+        _id = int(_id)
+        if _id in self.delta:
+            sentence, vector, code = self.delta[_id]
+            return sentence, vector, self.labels[code]
+
+        p = self._position(_id)
+        if p is None or not self.alive[p]:
+            raise KeyError(_id)
+
+        return self._row(p)
+
+    def __setitem__(self, _id: int, row: Tuple[str, np.ndarray, str]) -> None:
+        sentence, vector, intent = row
+        vector = np.asarray(vector, dtype=self.dtype).reshape(1, self.dim)
+        if int(_id) in self.delta:
+            self._count(self.labels[self.delta[int(_id)][2]], -1)
+
+        self.delta[int(_id)] = (sentence, vector, self.code(intent))
+        self._count(intent, 1)
+
+    def __contains__(self, _id: int) -> bool:
+        _id = int(_id)
+        if _id in self.delta:
+            return True
+
+        p = self._position(_id)
+        return p is not None and bool(self.alive[p])
+
+    def __len__(self) -> int:
+        return self.num_alive + len(self.delta)
+
+    def _count(self, intent: str, delta: int) -> None:
+        count = self.counts.get(intent, 0) + delta
+        if count == 0:
+            del self.counts[intent]
+        else:
+            self.counts[intent] = count
+
+    def _position(self, _id: int) -> Optional[int]:
+        p = int(np.searchsorted(self.ids, _id))
+        if p < len(self.ids) and self.ids[p] == _id:
+            return p
+        return None
+
+    def _row(self, p: int) -> Tuple[str, np.ndarray, str]:
+        begin, end = int(self.offsets[p]), int(self.offsets[p + 1])
+        sentence = self.sentences[begin:end].tobytes().decode("utf-8")
+        return sentence, self.vectors[p:p + 1], self.labels[self.intents[p]]
@@ -0,0 +1,263 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+from typing import Optional
+
+import faiss
+
+COMPRESSIONS = [None, "fp16", "sq8", "pq"]
+
+
+class IndexPolicy:
+
+    def __init__(
+        self,
+        flat_threshold: int = 10000,
+        hnsw_threshold: int = 1000000,
+        nlist_factor: float = 4.0,
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+        retrain_ratio: float = 2.0,
+    ) -> None:
+        """
+        Policy to choose type of faiss index by the number of data.
+
+        - flat: exact search, number of data < flat_threshold
+        - ivf: inverted lists with `nlist_factor * sqrt(number of data)` clusters,
+            flat_threshold <= number of data < hnsw_threshold
+        - ivf_hnsw: ivf whose clusters are searched with HNSW,
+            hnsw_threshold <= number of data
+
+        Vectors in the index can be compressed.
+
+        - None: float32, 4 bytes per dimension
+        - fp16: float16 scalar quantization, 2 bytes per dimension
+        - sq8: int8 scalar quantization, 1 byte per dimension
+        - pq: product quantization, 1 byte per 8 dimensions.
+            flat index uses sq8 instead, because k-means of pq needs much data.
+
+        Args:
+            flat_threshold (int): minimum number of data to use ivf index
+            hnsw_threshold (int): minimum number of data to use ivf_hnsw index
+            nlist_factor (float): number of clusters per square root of number of data
+            nprobe (int): number of clusters to search in ivf indices
+            hnsw_m (int): number of neighbors of HNSW graph
+            ef_search (int): size of HNSW candidate list for searching clusters
+            retrain_ratio (float): retrain ivf indices when the number of data grows
+                by this ratio since the last training.
+
+        References:
+            Billion-scale similarity search with GPUs (Johnson et al., 2017)
+            https://arxiv.org/abs/1702.08734
+
+            Efficient and robust approximate nearest neighbor search
+            using Hierarchical Navigable Small World graphs (Malkov et al., 2016)
+            https://arxiv.org/abs/1603.09320
+
+        Examples:
+            >>> policy = IndexPolicy(flat_threshold=50000, nprobe=32)
+            >>> retriever = IntentRetriever(index_policy=policy)
+        """
+
+        self.flat_threshold = flat_threshold
+        self.hnsw_threshold = hnsw_threshold
+        self.nlist_factor = nlist_factor
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.retrain_ratio = retrain_ratio
+
+    def kind(self, ntotal: int) -> str:
+        """
+        Args:
+            ntotal (int): number of data
+
+        Returns:
+            (str): one of ['flat', 'ivf', 'ivf_hnsw']
+        """
+
+        if ntotal < self.flat_threshold:
+            return "flat"
+        elif ntotal < self.hnsw_threshold:
+            return "ivf"
+        else:
+            return "ivf_hnsw"
+
+    @staticmethod
+    def kind_of(index: faiss.Index) -> str:
+        """
+        Args:
+            index (faiss.Index): faiss index
+
+        Returns:
+            (str): one of ['flat', 'ivf', 'ivf_hnsw']
+        """
+
+        try:
+            ivf = faiss.extract_index_ivf(index)
+        except RuntimeError:
+            return "flat"
+
+        quantizer = faiss.downcast_index(ivf.quantizer)
+        return "ivf_hnsw" if isinstance(quantizer, faiss.IndexHNSW) else "ivf"
+
+    @staticmethod
+    def code_size(index: faiss.Index) -> int:
+        """
+        Args:
+            index (faiss.Index): faiss index
+
+        Returns:
+            (int): number of bytes to store a vector in the index
+        """
+
+        try:
+            return faiss.extract_index_ivf(index).code_size
+        except RuntimeError:
+            return faiss.downcast_index(index.index).code_size
+
+    def is_compressed_as(
+        self,
+        index: faiss.Index,
+        dim: int,
+        compression: Optional[str],
+    ) -> bool:
+        """
+        Args:
+            index (faiss.Index): faiss index
+            dim (int): dimension of vectors
+            compression (Optional[str]): one of [None, 'fp16', 'sq8', 'pq']
+
+        Returns:
+            (bool): whether vectors in the index are compressed with the compression
+        """
+
+        flat = self.kind_of(index) == "flat"
+        code_size = {
+            None: dim * 4,
+            "fp16": dim * 2,
+            "sq8": dim,
+            "pq": dim if flat else dim // 8,
+        }[compression]
+
+        return self.code_size(index) == code_size
+
+    def nlist(self, ntotal: int) -> int:
+        """
+        Args:
+            ntotal (int): number of data
+
+        Returns:
+            (int): number of clusters of ivf indices.
+                at least 39 data per cluster are left for k-means.
+        """
+
+        nlist = int(self.nlist_factor * math.sqrt(ntotal))
+        return max(1, min(nlist, ntotal // 39))
+
+    def build(
+        self,
+        dim: int,
+        ntotal: int,
+        compression: Optional[str] = None,
+    ) -> faiss.Index:
+        """
+        Create new empty index for the number of data.
+
+        Args:
+            dim (int): dimension of vectors
+            ntotal (int): number of data
+            compression (Optional[str]): one of [None, 'fp16', 'sq8', 'pq']
+
+        Returns:
+            (faiss.Index): index which supports `add_with_ids` and `remove_ids`
+        """
+
+        assert compression in COMPRESSIONS, \
+            f"param `compression` must be one of {COMPRESSIONS}"
+
+        kind = self.kind(ntotal)
+        encoding = {
+            None: "Flat",
+            "fp16": "SQfp16",
+            "sq8": "SQ8",
+            "pq": f"PQ{dim // 8}" if kind != "flat" else "SQ8",
+        }[compression]
+
+        if kind == "flat":
+            description = f"IDMap2,{encoding}"
+        elif kind == "ivf":
+            description = f"IVF{self.nlist(ntotal)},{encoding}"
+        else:
+            description = f"IVF{self.nlist(ntotal)}_HNSW{self.hnsw_m},{encoding}"
+
+        index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+        self.configure(index)
+        return index
+
+    def configure(self, index: faiss.Index) -> None:
+        """
+        Set search parameters of the index.
+
+        Args:
+            index (faiss.Index): faiss index
+        """
+
+        if self.kind_of(index) == "flat":
+            return
+
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(self.nprobe, ivf.nlist)
+
+        quantizer = faiss.downcast_index(ivf.quantizer)
+        if isinstance(quantizer, faiss.IndexHNSW):
+            quantizer.hnsw.efSearch = max(self.ef_search, ivf.nprobe)
+
+    def need_rebuild(self, index: faiss.Index, ntotal: int, trained_ntotal: int) -> bool:
+        """
+        Check whether the index must be rebuilt before adding new vectors.
+
+        Args:
+            index (faiss.Index): current index
+            ntotal (int): number of data after adding new vectors
+            trained_ntotal (int): number of data used for the last training
+
+        Returns:
+            (bool): whether to rebuild the index or not
+        """
+
+        if not index.is_trained:
+            return True
+
+        kinds = ["flat", "ivf", "ivf_hnsw"]
+        thresholds = [0, self.flat_threshold, self.hnsw_threshold]
+        current = kinds.index(self.kind_of(index))
+        target = kinds.index(self.kind(ntotal))
+
+        if target > current:
+            # migrate to the index type for the new number of data
+            return True
+
+        if target < current and ntotal * 2 < thresholds[current]:
+            # migrate down only after the number of data has clearly decreased
+            # not to rebuild the index repeatedly around a threshold.
+            return True
+
+        if current == 0 and self.code_size(index) != index.d:
+            # flat index needs no training except ranges of int8 quantizer.
+            return False
+
+        return trained_ntotal == 0 or ntotal >= trained_ntotal * self.retrain_ratio
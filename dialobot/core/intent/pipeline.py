@@ -14,10 +14,16 @@
 
 import os
 from collections import Counter
-from typing import List, Union, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union, Dict, Any, Tuple, Optional
+
+import faiss
+import torch
 
 from dialobot.core.base import IntentBase
 from dialobot.core.utils.const import MODEL_ALIAS
+from dialobot.core.utils.cache import EmbeddingCache
+from dialobot.core.utils.batcher import AsyncBatcher
 from dialobot.core.intent.classifier import IntentClassifier
 from dialobot.core.intent.retriever import IntentRetriever
 
@@ -39,13 +45,23 @@ class Intent(IntentBase):
         dataset_file: str = "dataset.pkl",
         topk: int = 5,
         retriever_model: str = "paraphrase-multilingual-MiniLM-L12-v2",
+        compression: Optional[str] = None,
+        rerank: int = 0,
+        cache: Optional[EmbeddingCache] = None,
+        precision: str = "fp32",
+        backend: str = "torch",
+        cascade_threshold: float = 0.9,
+        cascade_topm: int = 3,
+        num_workers: int = 2,
+        batching: Optional[Dict[str, Any]] = None,
+        num_threads: Optional[int] = None,
     ):
         """
         Dialobot Intent Module
 
         Args:
             lang (str): language
-            model (str): select model [classifier(clf), retriever(rtv), both]
+            model (str): select model [classifier(clf), retriever(rtv), both, cascade]
             device (str): choose 1 between cpu and gpu
             fallback_threshold (str): threshold for fallback checking
             idx_path (str): path to save retriever dataset
@@ -53,6 +69,20 @@ class Intent(IntentBase):
             dataset_file (str): file name of retriever dataset
             topk (int): number of distances to return
             retriever_model (str): retriever model name for sentence transformers
+            compression (Optional[str]): compression of retriever vectors.
+                must be one of [None, 'fp16', 'sq8', 'pq']
+            rerank (int): number of retriever candidates to re-rank with exact similarities
+            cache (EmbeddingCache): cache of retriever embeddings of input sentences
+            precision (str): precision of classifier model, one of ['fp32', 'int8-dynamic', 'bf16']
+            backend (str): inference backend of models, one of ['torch', 'onnx']
+            cascade_threshold (float): similarity of retriever to decide intent
+                without classifier in cascade model
+            cascade_topm (int): number of retriever candidates rescored by classifier in cascade model
+            num_workers (int): number of threads to run classifier and retriever concurrently in both model
+            batching (Optional[Dict[str, Any]]): arguments of `MicroBatchScheduler` for classifier
+                and retriever to run models for concurrent requests together, e.g. {"max_batch": 64, "max_wait": 5}
+            num_threads (Optional[int]): number of threads shared by classifier and retriever in both model.
+                `os.cpu_count()` is used if it is None.
 
         Examples:
             >>>> # 1. create classifier
@@ -70,20 +100,54 @@ class Intent(IntentBase):
             >>> intent.recognize("Tell me today's weather", intents=["weather", "restaurant"], detail=True)
             {'intent': 'weather', 'scores': {'weather': 0.75165, 'restaurant': 0.0004, ...}}
 
+        Note:
+            In cascade model, retriever decides intent if its similarity is higher than
+            `cascade_threshold`. Otherwise classifier rescores only `cascade_topm` candidates
+            of retriever, so cost of classifier does not grow with the number of intents.
+            In both model, classifier and retriever run concurrently on a thread pool
+            of the pipeline, and each of them uses half of `num_threads`.
+            torch and faiss threads are process-wide, so they are set once here,
+            and onnx sessions are created with their own number of threads.
+            The stages run one after the other if `num_threads` can not be split.
+
         """
         model = model.lower()
         if model not in self.availabel_models():
             model = MODEL_ALIAS[model]
 
         assert model in self.availabel_models(), \
-            "currently we support only Classifier, Retriever, Both Model. \n"\
-            "So, param `model` must be one of ['clf', 'rtv', 'both']"
+            "currently we support only Classifier, Retriever, Both, Cascade Model. \n"\
+            "So, param `model` must be one of ['clf', 'rtv', 'both', 'cascade']"
 
         self.model = model
         self.device = device
+        self.cascade_threshold = cascade_threshold
+        self.cascade_topm = cascade_topm
+        self.executor = None
+        self.batcher: Optional[AsyncBatcher] = None
+        stage_threads = None
+
+        if model == "both":
+            num_threads = num_threads if num_threads is not None else os.cpu_count() or 1
+            stage_threads = max(1, num_threads // 2)
+            # stages running concurrently would oversubscribe cores without the budget.
+            torch.set_num_threads(stage_threads)
+            faiss.omp_set_num_threads(stage_threads)
+
+            if num_threads >= 2:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=num_workers,
+                    thread_name_prefix="dialobot-intent",
+                )
 
         if model == "clf":
-            self.clf = IntentClassifier(lang=lang)
+            self.clf = IntentClassifier(
+                lang=lang,
+                device=self.device,
+                precision=precision,
+                backend=backend,
+                batching=batching,
+            )
             self.rtv = None
 
         elif model == "rtv":
@@ -95,12 +159,21 @@ class Intent(IntentBase):
                 dataset_file=dataset_file,
                 topk=topk,
                 fallback_threshold=fallback_threshold,
+                compression=compression,
+                rerank=rerank,
+                cache=cache,
+                backend=backend,
+                batching=batching,
             )
 
-        elif model == "both":
+        elif model in ["both", "cascade"]:
             self.clf = IntentClassifier(
                 lang=lang,
                 device=self.device,
+                precision=precision,
+                backend=backend,
+                batching=batching,
+                num_threads=stage_threads,
             )
 
             self.rtv = IntentRetriever(
@@ -110,6 +183,12 @@ class Intent(IntentBase):
                 dataset_file=dataset_file,
                 topk=topk,
                 fallback_threshold=fallback_threshold,
+                compression=compression,
+                rerank=rerank,
+                cache=cache,
+                backend=backend,
+                batching=batching,
+                num_threads=stage_threads,
             )
 
         else:
@@ -117,7 +196,7 @@ class Intent(IntentBase):
 
     @staticmethod
     def availabel_models():
-        return ["clf", "rtv", "both"]
+        return ["clf", "rtv", "both", "cascade"]
 
     def add(
         self,
@@ -142,6 +221,17 @@ class Intent(IntentBase):
 
         return self.rtv.remove(data)
 
+    def remove_many(
+        self,
+        data: List[Tuple[str, str]],
+    ) -> None:
+
+        assert self.model not in [
+            "clf"
+        ], f"You do not need to remove data in classifier models."
+
+        return self.rtv.remove_many(data)
+
     def clear(self) -> None:
 
         assert self.model not in [
@@ -167,46 +257,245 @@ class Intent(IntentBase):
         elif self.model == "rtv":
             return self.rtv.recognize(text=text, detail=detail, voting=voting)
 
+        elif self.model == 'cascade':
+            return self.cascade(text=text, detail=detail, intents=intents, voting=voting)
+
         elif self.model == 'both':
-            rtv_intents = self.rtv.intents()
-            if intents is None:
-                clf_out = self.clf.recognize(
-                    text=text,
-                    intents=rtv_intents,
-                    detail=detail,
-                )
-                rtv_out = self.rtv.recognize(
-                    text=text,
-                    voting=voting,
-                    detail=detail,
-                )
-            else:
-                for input_intent in intents:
-                    assert input_intent in rtv_intents, \
-                        "`{}` is an intent that has not been trained in the retriever model.".format(input_intent)
-                clf_out = self.clf.recognize(
-                    text=text,
-                    intents=intents,
+            return self.recognize_batch([text], detail=detail, intents=intents, voting=voting)[0]
+
+    def intent_counts(self) -> Dict[str, int]:
+        """
+        Returns:
+            (Dict[str, int]): intent -> number of retriever data
+        """
+
+        assert self.model not in [
+            "clf"
+        ], f"Classifier models do not have data."
+
+        return self.rtv.intent_counts()
+
+    def recognize_batch(
+        self,
+        texts: List[str],
+        detail: bool = False,
+        intents: List[str] = None,
+        voting: str = "soft",
+    ) -> List[Union[str, Dict[str, Any]]]:
+        """
+        Recognize intents of many sentences.
+        Retriever searches every sentence at once, and classifier scores
+        pairs of sentences and intents together. (see `IntentClassifier.recognize_batch`)
+
+        Args:
+            texts (List[str]): input sentences
+            detail (bool): whether to return details or not
+            intents (List[str]): candidate intents
+            voting (str): voting method for kNN search of retriever
+
+        Returns:
+            (List[Union[str, Dict[str, Any]]]): outputs of `recognize` for every sentence
+        """
+
+        assert self.model not in ["clf"] or intents is not None, \
+            "In classifier model, you must put intents(List[str])."
+
+        texts = list(texts)
+        if self.model == "clf":
+            return self.clf.recognize_batch(texts, intents=intents, detail=detail)
+
+        elif self.model == "rtv":
+            return self.rtv.recognize_batch(texts, detail=detail, voting=voting)
+
+        elif self.model == "cascade":
+            return self._cascade(texts, detail=detail, intents=intents, voting=voting)
+
+        if intents is None:
+            intents = self.rtv.intents()
+        else:
+            for input_intent in intents:
+                assert self.rtv.has_intent(input_intent), \
+                    "`{}` is an intent that has not been trained in the retriever model.".format(input_intent)
+
+        if self.executor is None:
+            clf_outs = self.clf.recognize_batch(texts, intents=intents, detail=detail)
+            rtv_outs = self.rtv.recognize_batch(texts, voting=voting, detail=detail)
+
+        else:
+            clf_future = self.executor.submit(
+                self.clf.recognize_batch,
+                texts,
+                intents=intents,
+                detail=detail,
+            )
+            rtv_future = self.executor.submit(
+                self.rtv.recognize_batch,
+                texts,
+                voting=voting,
+                detail=detail,
+            )
+            clf_outs, rtv_outs = clf_future.result(), rtv_future.result()
+
+        return [
+            self._both(clf_out, rtv_out, detail)
+            for clf_out, rtv_out in zip(clf_outs, rtv_outs)
+        ]
+
+    @staticmethod
+    def _both(clf_out: Any, rtv_out: Any, detail: bool) -> Union[str, Dict[str, Any]]:
+        if detail:
+            intent = 'fallback' if clf_out['intent'] != rtv_out[
+                'intent'] else clf_out['intent']
+
+            return {
+                "intent": intent,
+                "scores": {
+                    k: round(v, 5) for k, v in dict(
+                        Counter(clf_out["scores"]) +
+                        Counter(rtv_out["scores"])).items()
+                },
+            }
+
+        else:
+            intent = 'fallback' if clf_out != rtv_out else clf_out
+            return intent
+
+    async def arecognize(
+        self,
+        text: str,
+        detail: bool = False,
+        intents: List[str] = None,
+        voting: str = "soft",
+    ) -> Union[str, Dict[str, Any]]:
+        """
+        Coroutine version of `recognize` which does not block the event loop.
+        Models run on a thread pool of the pipeline, and concurrent callers
+        are coalesced into batches. (see `AsyncBatcher`)
+        Cancelled callers are dropped before their batch runs.
+
+        Examples:
+            >>> intent = Intent(lang="en", model="rtv")
+            >>> await intent.arecognize("Tell me today's weather")
+            'weather'
+        """
+
+        if self.batcher is None:
+            self.batcher = AsyncBatcher(self._recognize_items)
+
+        options = (detail, tuple(intents) if intents is not None else None, voting)
+        return await self.batcher.submit((text, options))
+
+    def _recognize_items(self, items: List[Tuple[str, Tuple]]) -> List[Any]:
+        """
+        Recognize items of `arecognize`, items with the same options are batched together.
+        """
+
+        groups: Dict[Tuple, List[int]] = {}
+        for i, (_, options) in enumerate(items):
+            groups.setdefault(options, []).append(i)
+
+        results: List[Any] = [None] * len(items)
+        for (detail, intents, voting), indices in groups.items():
+            try:
+                outputs = self.recognize_batch(
+                    [items[i][0] for i in indices],
                     detail=detail,
-                )
-                rtv_out = self.rtv.recognize(
-                    text=text,
+                    intents=list(intents) if intents is not None else None,
                     voting=voting,
-                    detail=detail,
                 )
-            if detail:
-                intent = 'fallback' if clf_out['intent'] != rtv_out[
-                    'intent'] else clf_out['intent']
-
-                return {
-                    "intent": intent,
-                    "scores": {
-                        k: round(v, 5) for k, v in dict(
-                            Counter(clf_out["scores"]) +
-                            Counter(rtv_out["scores"])).items()
-                    },
-                }
+            except Exception as e:
+                outputs = [e] * len(indices)
+
+            for i, output in zip(indices, outputs):
+                results[i] = output
+
+        return results
+
+    def close(self) -> None:
+        """
+        Shut down thread pools of the pipeline.
+        """
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+        if self.batcher is not None:
+            self.batcher.close()
+
+        for module in (self.clf, self.rtv):
+            if module is not None and module.scheduler is not None:
+                module.scheduler.close()
+
+    def cascade(
+        self,
+        text: str,
+        detail: bool = False,
+        intents: List[str] = None,
+        voting: str = "soft",
+    ) -> Union[str, Dict[str, Any]]:
+        """
+        Recognize intent with retriever first, and rescore its top candidates
+        with classifier only if retriever is not confident.
+
+        Args:
+            text (str): input sentence
+            detail (bool): whether to return details or not
+            intents (List[str]): candidate intents. every trained intent if it is None.
+            voting (str): voting method for kNN search of retriever
+
+        Returns:
+            (str): intent of input sentence (detail=False)
+            (Dict[str, Any]): intent and scores of the model which decided the intent (detail=True)
+        """
+
+        return self._cascade([text], detail=detail, intents=intents, voting=voting)[0]
+
+    def _cascade(
+        self,
+        texts: List[str],
+        detail: bool = False,
+        intents: List[str] = None,
+        voting: str = "soft",
+    ) -> List[Union[str, Dict[str, Any]]]:
+        """
+        Batch version of `cascade`. Sentences rescored with the same candidates
+        are scored by classifier together.
+        """
+
+        if intents is not None:
+            for input_intent in intents:
+                assert self.rtv.has_intent(input_intent), \
+                    "`{}` is an intent that has not been trained in the retriever model.".format(input_intent)
+
+        outs: List[Any] = [None] * len(texts)
+        rescored: Dict[Tuple[str, ...], List[int]] = {}
+
+        for i, rtv_out in enumerate(self.rtv.recognize_batch(texts, voting=voting, detail=True)):
+            rtv_scores = {
+                k: v for k, v in rtv_out["scores"].items()
+                if intents is None or k in intents
+            }
+
+            if rtv_out["intent"] == "fallback" or len(rtv_scores) == 0:
+                outs[i] = {"intent": "fallback", "scores": rtv_scores}
+
+            elif rtv_out["intent"] in rtv_scores and \
+                    rtv_scores[rtv_out["intent"]] >= self.cascade_threshold:
+                outs[i] = {"intent": rtv_out["intent"], "scores": rtv_scores}
 
             else:
-                intent = 'fallback' if clf_out != rtv_out else clf_out
-                return intent
+                # voted intent is always rescored, and then the most similar intents.
+                candidates = [k for k in [rtv_out["intent"]] if k in rtv_scores]
+                candidates += [k for k in rtv_scores if k not in candidates]
+                rescored.setdefault(tuple(candidates[:self.cascade_topm]), []).append(i)
+
+        for candidates, indices in rescored.items():
+            clf_outs = self.clf.recognize_batch(
+                [texts[i] for i in indices],
+                intents=list(candidates),
+                detail=True,
+            )
+            for i, out in zip(indices, clf_outs):
+                outs[i] = out
+
+        return outs if detail else [out["intent"] for out in outs]
@@ -12,14 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Union, Dict, List, Tuple
+from typing import Any, Union, Dict, List, Tuple, Optional
 from sentence_transformers import SentenceTransformer
 from dialobot.core.base import IntentBase
 from dialobot.core.utils.const import RETRIEVER_MODELS_DIMENSION
+from dialobot.core.utils.cache import EmbeddingCache
+from dialobot.core.utils.scheduler import MicroBatchScheduler
+from dialobot.core.utils.backend import BACKENDS, OnnxSentenceEncoder
 
 import os
+import threading
+import warnings
 import numpy as np
-import pickle
 
 try:
     import faiss
@@ -29,6 +33,10 @@ except ImportError as e:
         "- CPU user: `pip install faiss-cpu`\n"
         "- GPU user: `pip install faiss-gpu`\n")
 
+from dialobot.core.intent.dataset import IntentDataset
+from dialobot.core.intent.index import IndexPolicy, COMPRESSIONS
+from dialobot.core.intent.storage import RetrieverStorage
+
 
 class IntentRetriever(IntentBase):
 
@@ -44,7 +52,18 @@ class IntentRetriever(IntentBase):
         dataset_file: str = "dataset.pkl",
         fallback_threshold: float = 0.6,
         topk: int = 5,
-        labeling_count: int = 20,
+        index_policy: Optional[IndexPolicy] = None,
+        batch_size: int = 32,
+        compact_ratio: float = 0.5,
+        checkpoint_interval: int = 1000,
+        compression: Optional[str] = None,
+        rerank: int = 0,
+        cache: Optional[EmbeddingCache] = None,
+        backend: str = "torch",
+        batching: Optional[Dict[str, Any]] = None,
+        labeling_count: Optional[int] = None,
+        retrain_ratio: Optional[float] = None,
+        num_threads: Optional[int] = None,
         device="cpu",
     ) -> None:
         """
@@ -58,7 +77,30 @@ class IntentRetriever(IntentBase):
             dataset_file (str): file name of dataset
             fallback_threshold (float): threshold for fallback checking
             topk (int): number of distances to return
-            labeling_count (int) : Minimum Labeling Count
+            index_policy (IndexPolicy): policy to choose type of faiss index
+                by the number of data. `IndexPolicy()` is used if it is None.
+            batch_size (int): batch size for sentence encoding
+            compact_ratio (float): compact IVF indices when the number of removed data
+                reaches this ratio of the number of data used for the last training.
+            checkpoint_interval (int): number of mutations (add, remove, clear)
+                to write a new checkpoint of dataset and index in the background.
+            compression (Optional[str]): compression of vectors in the index.
+                must be one of [None, 'fp16', 'sq8', 'pq']. (see `IndexPolicy`)
+                vectors in dataset are stored as float16 if it is not None.
+            rerank (int): number of candidates to re-rank with exact similarities
+                of vectors in dataset. candidates are not re-ranked if it is 0.
+            cache (EmbeddingCache): cache of embeddings of input sentences to recognize.
+                `EmbeddingCache()` is used if it is None. use `EmbeddingCache(maxsize=0)` to disable it.
+            backend (str): inference backend of sentence encoder, one of ['torch', 'onnx'].
+                onnx model is exported to `~/.dialobot/onnx/` for the first time.
+            batching (Optional[Dict[str, Any]]): arguments of `MicroBatchScheduler`
+                to encode sentences of concurrent requests together, e.g. {"max_batch": 64, "max_wait": 5}.
+                sentences of each request are encoded by themselves if it is None.
+            labeling_count (Optional[int]): deprecated, use `IndexPolicy(flat_threshold=...)`.
+                minimum number of data to use ivf index.
+            retrain_ratio (Optional[float]): deprecated, use `IndexPolicy(retrain_ratio=...)`.
+            num_threads (Optional[int]): number of intra-op threads of onnx backend.
+                default of ONNX Runtime is used if it is None.
 
         References:
             Universal Sentence Encoder (Cer et al., 2018)
@@ -68,10 +110,17 @@ class IntentRetriever(IntentBase):
             https://arxiv.org/abs/1702.08734
 
         Note:
-            If the number of data is smaller than the labeling_count,
-            it is classified as 'the number of data',
-            and if it is more than that,
-            it is classified as 'int(the number of data / topk)' labels.
+            Small dataset is searched exactly with a flat index, and larger dataset
+            is searched with IVF indices whose number of clusters is proportional to
+            the square root of the number of data. (see `IndexPolicy`)
+            The index migrates to another type as the dataset grows, and IVF indices
+            are retrained only when the number of data reaches `index_policy.retrain_ratio`
+            times the number of data used for the last training.
+            Mutations are appended to a log in `idx_path` and dataset and index are
+            rewritten as a checkpoint every `checkpoint_interval` mutations.
+            The log is replayed on top of the latest checkpoint when loading.
+            If `compression` is different from that of the saved index,
+            the index is rebuilt from dataset and a new checkpoint is written.
 
         Examples:
             >>> # 1. create retriever
@@ -80,8 +129,9 @@ class IntentRetriever(IntentBase):
             >>> retriever.add(("What time is it now?", "time"))
             >>> retriever.add(("Tell me today's weather", "weather"))
             >>> retriever.add([("What time do we meet tomorrow?", "time"),  ("How will the weather be tomorrow?", "weather")])
-            >>> # 3. remove data
+            >>> # 3. remove data, batch data
             >>> retriever.remove(("What time is it now?", "time"))
+            >>> retriever.remove_many([("What time do we meet tomorrow?", "time")])
             >>> # 4. recognize intent
             >>> retriever.recognize("Tell me tomorrow's weather")
             'weather'
@@ -93,38 +143,101 @@ class IntentRetriever(IntentBase):
         """
         assert model in self.available_models(), \
             "param `retriever_model` must be one of {}".format(str(list(self.available_models())))
+        assert backend in BACKENDS, \
+            f"param `backend` must be one of {BACKENDS}"
         self.device = device
         self.model = SentenceTransformer(model).to(self.device)
+        if backend == "onnx":
+            assert device == "cpu", "onnx backend is only available on cpu."
+            self.model = OnnxSentenceEncoder(self.model, model, num_threads=num_threads)
+        self.model_name = model
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.scheduler: Optional[MicroBatchScheduler] = None
+        if batching is not None:
+            self.scheduler = MicroBatchScheduler(
+                lambda texts: list(self.model.encode(texts, batch_size=self.batch_size)),
+                name="dialobot-rtv-scheduler",
+                **batching,
+            )
         self.dim = RETRIEVER_MODELS_DIMENSION[model]
         self.topk = topk
-        self.labeling_count = labeling_count
-
-        self.quantizer = faiss.IndexFlatIP(self.dim)
+        self.index_policy = index_policy if index_policy is not None else IndexPolicy()
+        if labeling_count is not None or retrain_ratio is not None:
+            assert index_policy is None, \
+                "param `labeling_count` and `retrain_ratio` can not be used with `index_policy`"
+            warnings.warn(
+                "param `labeling_count` and `retrain_ratio` are deprecated. "
+                "use `index_policy=IndexPolicy(flat_threshold=..., retrain_ratio=...)` instead.",
+                DeprecationWarning,
+            )
+            if labeling_count is not None:
+                self.index_policy.flat_threshold = labeling_count
+            if retrain_ratio is not None:
+                self.index_policy.retrain_ratio = retrain_ratio
+        self.batch_size = batch_size
+        self.compact_ratio = compact_ratio
+
+        assert compression in COMPRESSIONS, \
+            f"param `compression` must be one of {COMPRESSIONS}"
+        assert rerank >= 0, "param `rerank` must be non-negative"
+        self.compression = compression
+        self.rerank = rerank
+        self.vector_dtype = np.float32 if compression is None else np.float16
 
         self.idx_path = idx_path
         self.idx_file = idx_file
         self.dataset_file = dataset_file
         self.fallback_threshold = fallback_threshold
 
-        if os.path.exists(idx_path + idx_file):
-            self.index = faiss.read_index(idx_path + idx_file)
-            self.nlist = int(self.index.ntotal / self.topk)
+        self.lock = threading.RLock()
+        self.storage = RetrieverStorage(
+            idx_path=idx_path,
+            idx_file=idx_file,
+            dataset_file=dataset_file,
+            checkpoint_interval=checkpoint_interval,
+        )
+        self._checkpoint_thread: Optional[threading.Thread] = None
+        # exception of checkpoint written in the background, raised by `checkpoint`
+        self._checkpoint_error: Optional[Exception] = None
+        # (snapshot, saved dataset) of the last checkpoint, not applied to dataset yet
+        self._checkpointed: Optional[Tuple[IntentDataset, IntentDataset]] = None
+        index, dataset, records = self.storage.load()
+
+        if index is not None:
+            self.index = index
+            self.index_policy.configure(self.index)
         else:
-            self.nlist = 1
-            self.index = faiss.IndexIVFFlat(
-                self.quantizer,
-                self.dim,
-                self.nlist,
-                faiss.METRIC_INNER_PRODUCT,
-            )
-
-        if os.path.exists(idx_path + dataset_file):
-            with open(idx_path + dataset_file, mode="rb") as f:
-                self.dataset: List[Tuple[str, np.ndarray, str]] = pickle.load(f)
+            self.index = self._build(0)
+
+        # number of data used for the last training of the index
+        # and number of data removed from the index since then
+        self.trained_ntotal = self.index.ntotal
+        self.removed_ntotal = 0
+
+        if dataset is None:
+            dataset = IntentDataset(self.dim, self.vector_dtype)
+        elif isinstance(dataset, list):
+            # pickled dataset of previous versions, ids of index were row numbers.
+            dataset = IntentDataset.from_rows(
+                dict(enumerate(dataset)), self.dim, self.vector_dtype)
         else:
-            os.makedirs(idx_path, exist_ok=True)
-            self.dataset: List[Tuple[str, np.ndarray, str]] = []
-            # list of (sentence, vector, intent)
+            # columns of the checkpoint are converted when it is saved next time.
+            dataset.dtype = np.dtype(self.vector_dtype)
+
+        self.dataset: IntentDataset = dataset
+        # id of index -> (sentence, vector, intent)
+
+        self.next_id = self.dataset.max_id() + 1
+        # (sentence, intent) -> id of index, built lazily on first access
+        self._lookup: Optional[Dict[Tuple[str, str], int]] = None
+
+        for record in records:
+            self._apply(*record)
+
+        if not self.index_policy.is_compressed_as(self.index, self.dim, self.compression):
+            self._rebuild()
+            if len(self.dataset) != 0:
+                self.checkpoint()
 
     def add(self,
             data: Union[Tuple[str, str], List[Tuple[str, str]]],
@@ -146,78 +259,41 @@ class IntentRetriever(IntentBase):
             Raises exceptoin when you try to add existed data.
             Raises TypeError when you put in the wrong data type
         """
-        batch_flag = False
         if isinstance(data, tuple):
-            pass
+            data = [data]
         elif isinstance(data, list) and isinstance(data[0], tuple):
-            batch_flag = True
+            pass
         else:
             raise TypeError(
                 "This Data Type is only available for Tuple or List[Tuple]")
 
-        if batch_flag:
-            new_data = []
-            vectors = np.empty((0, 512), np.float32)
-            for new_d in data:
-                try:
-                    for d in self.dataset:
-                        if new_d[0] == d[0] and new_d[1] == d[2]:
-                            raise Exception
-                except Exception:
-                    if exist_ok:
-                        continue
-                    else:
-                        raise Exception(f"This data is already existed: {data}")
-                vector = self._vectorize(new_d[0])
-                new_data.append((new_d[0], vector, new_d[1]))
-                vectors = np.append(vectors, np.array(vector), axis=0)
+        with self.lock:
+            self._add(data, exist_ok)
+            self._maybe_checkpoint()
 
-        else:
-            for d in self.dataset:
-                if data[0] == d[0] and data[1] == d[2]:
-                    if exist_ok:
-                        return
-                    else:
-                        raise Exception(f"This data is already existed: {data}")
-
-            vector = self._vectorize(data[0])
-            new_data = (data[0], vector, data[1])
-            vectors = np.array(vector)
-
-        for _, vec, _ in self.dataset:
-            vectors = np.append(vectors, vec, axis=0)
-
-        if len(vectors) >= self.labeling_count:
-            self.nlist = int(len(vectors) / self.topk)
-            self.index = faiss.IndexIVFFlat(
-                self.quantizer,
-                self.dim,
-                self.nlist,
-                faiss.METRIC_INNER_PRODUCT,
-            )
-            self.index.train(vectors)
-            assert self.index.is_trained
+    def _add(self, data: List[Tuple[str, str]], exist_ok: bool) -> None:
+        new_pairs, seen = [], set()
+        for new_d in data:
+            if new_d in seen or new_d in self.lookup:
+                if exist_ok:
+                    continue
+                else:
+                    raise Exception(f"This data is already existed: {new_d}")
 
-            self.index.add(vectors)
+            new_pairs.append(new_d)
+            seen.add(new_d)
 
-        else:
-            self.index.train(vectors)
-            assert self.index.is_trained
-            if batch_flag:
-                for _, v, _ in new_data:
-                    self.index.add(v)
-            else:
-                self.index.add(vector)
-        if batch_flag:
-            for nd in new_data:
-                self.dataset.append(nd)
-        else:
-            self.dataset.append(new_data)
+        if len(new_pairs) == 0:
+            return
 
-        with open(self.idx_path + self.dataset_file, mode="wb") as f:
-            pickle.dump(self.dataset, f, pickle.HIGHEST_PROTOCOL)
+        sentences = [sentence for sentence, _ in new_pairs]
+        intents = [intent for _, intent in new_pairs]
+        # sentences to add are not cached not to evict frequent queries.
+        vectors = self._vectorize(sentences, use_cache=False)
+        ids = np.arange(self.next_id, self.next_id + len(vectors), dtype=np.int64)
 
-        faiss.write_index(self.index, self.idx_path + self.idx_file)
+        self.storage.append("add", ids, sentences, vectors, intents)
+        self._apply("add", ids, sentences, vectors, intents)
 
     def remove(self, data: Tuple[str, str]) -> None:
         """
@@ -234,44 +310,41 @@ class IntentRetriever(IntentBase):
             Raises exceptoin when you try to remove non-existed data.
         """
 
-        find = False
-        new_dataset = []
-        new_vectors = []
-        if self.ntotal() > self.labeling_count:
-            self.nlist = int(len(self.dataset) / self.topk)
-        else:
-            self.nlist = 1
-        new_index = faiss.IndexIVFFlat(self.quantizer, self.dim, self.nlist,
-                                       faiss.METRIC_INNER_PRODUCT)
-
-        for d in self.dataset:
-            if d[0] != data[0] or d[2] != data[1]:
-                new_dataset.append(d)
-                new_vectors.append(d[1].reshape(1, -1))
-            else:
-                find = True
+        self.remove_many([data])
 
-        if not find:
-            raise Exception(f"This data does not exist: {data}")
+    def remove_many(self, data: List[Tuple[str, str]]) -> None:
+        """
+        Remove batch data from dataset.
+        Vectors are removed from the index in place by their ids,
+        and the index is compacted when too many data have been removed.
 
-        if len(new_vectors) != 0:
-            new_index.train(np.concatenate(new_vectors, axis=0))
-            new_index.add(np.concatenate(new_vectors, axis=0))
+        Args:
+            data (List[Tuple[str, str]]): list of (sentence, intent)
 
-        self.dataset = new_dataset
-        self.index = new_index
+        Examples:
+            >>> retriever = IntentRetriever()
+            >>> retriever.remove_many([("What time is it now?", "time"), ("Tell me today's weather", "weather")])
 
-        with open(self.idx_path + self.dataset_file, mode="wb") as f:
-            pickle.dump(
-                self.dataset,
-                f,
-                pickle.HIGHEST_PROTOCOL,
-            )
+        Raises:
+            Raises exceptoin when you try to remove non-existed data.
+            Nothing is removed in this case.
+        """
 
-        faiss.write_index(
-            self.index,
-            self.idx_path + self.idx_file,
-        )
+        with self.lock:
+            ids = []
+            for d in data:
+                _id = self.lookup.get(tuple(d))
+                if _id is None:
+                    raise Exception(f"This data does not exist: {d}")
+                ids.append(_id)
+
+            ids = np.unique(np.array(ids, dtype=np.int64))
+            if len(ids) == 0:
+                return
+
+            self.storage.append("remove", ids)
+            self._apply("remove", ids)
+            self._maybe_checkpoint()
 
     def clear(self) -> None:
         """
@@ -282,26 +355,34 @@ class IntentRetriever(IntentBase):
             >>> retriever.clear()
         """
 
-        self.dataset = []
-        self.nlist = 1
-        self.index = faiss.IndexIVFFlat(
-            self.quantizer,
-            self.dim,
-            self.nlist,
-            faiss.METRIC_INNER_PRODUCT,
-        )
+        with self.lock:
+            self.storage.append("clear")
+            self._apply("clear")
+            # checkpoint of empty dataset is cheap, and makes log empty.
+            self.checkpoint()
 
-        with open(self.idx_path + self.dataset_file, mode="wb") as f:
-            pickle.dump(
-                self.dataset,
-                f,
-                pickle.HIGHEST_PROTOCOL,
-            )
+    def checkpoint(self) -> None:
+        """
+        Write checkpoint of current dataset and index, and wait until it is finished.
 
-        faiss.write_index(
-            self.index,
-            self.idx_path + self.idx_file,
-        )
+        Examples:
+            >>> retriever = IntentRetriever()
+            >>> retriever.checkpoint()
+
+        Raises:
+            Raises exception when this checkpoint or any checkpoint written
+            in the background since the last call has failed.
+            Mutations are kept in the log, so nothing is lost in this case.
+        """
+
+        with self.lock:
+            self._maybe_checkpoint(force=True)
+            self._checkpoint_thread.join()
+            self._rebase()
+
+            error, self._checkpoint_error = self._checkpoint_error, None
+            if error is not None:
+                raise Exception(f"failed to write checkpoint: {error}") from error
 
     def recognize(
         self,
@@ -328,49 +409,90 @@ class IntentRetriever(IntentBase):
             'weather'
             >>> retriever.recognize("Tell me tomorrow's weather", detail=True)
             {'intent': 'weather', 'scores': {'weather': 0.98, 'greeting': 0.69, ...}
+
+        Note:
+            Each neighbor votes for its intent with its similarity (soft) or 1 (hard).
+            If intents are tied, the one with the most similar neighbor wins,
+            and then the one whose neighbor is found first.
+            `scores` of details are the highest similarity of each intent.
+        """
+
+        return self.recognize_batch([text], detail=detail, voting=voting)[0]
+
+    def recognize_batch(
+        self,
+        texts: List[str],
+        detail: bool = False,
+        voting: str = "soft",
+    ) -> List[Union[str, Dict[str, Union[str, List[Tuple[float, str]]]]]]:
+        """
+        Recognize intents of many sentences at once.
+        Sentences are encoded in batches and searched with a single faiss search,
+        and votes of every sentence are counted together.
+
+        Args:
+            texts (List[str]): input sentences
+            detail (bool): whether to return details or not
+            voting (str): voting method for kNN search.
+                must be one of ['soft', 'hard'].
+
+        Returns:
+            (List[str]): intents of input sentences (detail=False)
+            (List[Dict[str, Union[str, List[Tuple[float, str]]]]]): intents and distances (detail=True)
+
+        Examples:
+            >>> retriever = IntentRetriever()
+            >>> retriever.recognize_batch(["Tell me tomorrow's weather", "I'm hungry"])
+            ['weather', 'restaurant']
         """
 
         voting = voting.lower()
         assert voting in ['soft', 'hard'], \
             "param `voting` must be one of ['soft', 'hard']."
 
-        assert self.index.ntotal != 0, \
-            "empty index. please add new data using below codes.\n" \
-            ">>> retriever = IntentRetriver()\n" \
-            ">>> retriever.add((sentence, intent))"
-
-        topk = min(self.topk, self.index.ntotal)
-        vector = self._vectorize(text)
-        dists, indices = self.index.search(vector, topk)
-        dists, indices = dists[0], indices[0]
-        is_fallback = False
-
-        if max(dists) < self.fallback_threshold:
-            is_fallback = True
-
-        scores: Dict[str, float] = {}
-        for idx, d in zip(indices, dists):
-            intent = self.dataset[idx][2]
-            if intent not in scores:
-                scores[intent] = 0.0
-            if voting == "soft":
-                scores[intent] += d
+        if len(texts) == 0:
+            return []
+
+        # sentences are encoded without the lock not to block mutations,
+        # and index and dataset are read under the lock not to see a half applied mutation.
+        vectors = self._vectorize(list(texts))
+
+        with self.lock:
+            assert self.index.ntotal != 0, \
+                "empty index. please add new data using below codes.\n" \
+                ">>> retriever = IntentRetriver()\n" \
+                ">>> retriever.add((sentence, intent))"
+
+            topk = min(self.topk, self.index.ntotal)
+            if self.rerank > topk:
+                num_candidates = min(self.rerank, self.index.ntotal)
+                dists, indices = self.index.search(vectors, num_candidates)
+                dists, indices = self._rerank(vectors, indices, topk)
             else:
-                scores[intent] += 1
+                dists, indices = self.index.search(vectors, topk)
+
+            winners, is_fallback, best = self._vote(dists, indices, voting)
+            labels = self.dataset.labels
+
+        results = []
+        for i in range(len(texts)):
+            intent = 'fallback' if is_fallback[i] else labels[winners[i]]
 
-        scores: Dict[float, str] = {v: k for k, v in scores.items()}
-        intent = scores[sorted(scores, reverse=True)[0]]
-        intent = 'fallback' if is_fallback else intent
+            if not detail:
+                results.append(intent)
+                continue
 
-        if not detail:
-            return intent
+            voted = np.flatnonzero(best[i] > -np.inf)
+            voted = voted[np.argsort(-best[i][voted], kind="stable")]
+            results.append({
+                "intent": intent,
+                "scores": {
+                    labels[c]: round(float(best[i][c]), 5)
+                    for c in voted
+                },
+            })
 
-        return {
-            "intent": intent,
-            "scores": {
-                self.dataset[i][2]: round(d, 5) for i, d in zip(indices, dists)
-            },
-        }
+        return results
 
     def ntotal(self) -> int:
         """
@@ -401,7 +523,60 @@ class IntentRetriever(IntentBase):
             weather
 
         """
-        return list(set([i[2] for i in self.dataset]))
+        return self.dataset.unique_intents()
+
+    def has_intent(self, intent: str) -> bool:
+        """
+        Check whether intent has been trained in O(1)
+
+        Args:
+            intent (str): intent
+
+        Returns:
+            (bool): whether any data of the intent is in dataset or not
+
+        Examples:
+            >>> retriever = IntentRetriever()
+            >>> retriever.add(("Tell me tomorrow's weather", "weather"))
+            >>> retriever.has_intent("weather")
+            True
+        """
+
+        return intent in self.dataset.counts
+
+    def intent_counts(self) -> Dict[str, int]:
+        """
+        Return number of data of each intent
+
+        Returns:
+            (Dict[str, int]): intent -> number of data
+
+        Examples:
+            >>> retriever = IntentRetriever()
+            >>> retriever.add([("Tell me tomorrow's weather", "weather"), ("Tell me today's weather", "weather")])
+            >>> retriever.intent_counts()
+            {'weather': 2}
+        """
+
+        return dict(self.dataset.counts)
+
+    def __contains__(self, data: Tuple[str, str]) -> bool:
+        """
+        Check whether (sentence, intent) is in dataset
+
+        Args:
+            data (Tuple[str, str]): tuple of (sentence, intent)
+
+        Returns:
+            (bool): whether the data is in dataset or not
+
+        Examples:
+            >>> retriever = IntentRetriever()
+            >>> retriever.add(("Tell me tomorrow's weather", "weather"))
+            >>> ("Tell me tomorrow's weather", "weather") in retriever
+            True
+        """
+        return tuple(data) in self.lookup
 
     def __len__(self) -> int:
         """
@@ -417,20 +592,326 @@ class IntentRetriever(IntentBase):
         """
         return self.ntotal()
 
-    def _vectorize(self, text: str) -> np.ndarray:
+    def _rerank(
+        self,
+        vectors: np.ndarray,
+        indices: np.ndarray,
+        topk: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Re-rank candidates searched from compressed index
+        with exact similarities of vectors in dataset.
+
+        Args:
+            vectors (np.ndarray): query vectors, shape of (number of queries, dim)
+            indices (np.ndarray): ids of candidates, -1 for missing candidates
+            topk (int): number of neighbors to keep
+
+        Returns:
+            (np.ndarray): similarities of neighbors, shape of (number of queries, topk)
+            (np.ndarray): ids of neighbors, -1 for missing neighbors
         """
-        Create vector from input sentence.
+
+        num_queries, num_candidates = indices.shape
+        candidates = self.dataset.vectors_of(indices).reshape(
+            num_queries, num_candidates, self.dim)
+
+        dists = np.einsum("qkd,qd->qk", candidates, vectors)
+        dists[indices == -1] = -np.inf
+
+        order = np.argsort(-dists, axis=1, kind="stable")[:, :topk]
+        dists = np.take_along_axis(dists, order, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        return dists, indices
+
+    def _vote(
+        self,
+        dists: np.ndarray,
+        indices: np.ndarray,
+        voting: str,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Vote intents of neighbors for every query with intent codes.
 
         Args:
-            text (str): input sentence
+            dists (np.ndarray): similarities of neighbors, shape of (number of queries, topk)
+            indices (np.ndarray): ids of neighbors, -1 for missing neighbors
+            voting (str): voting method, one of ['soft', 'hard']
+
+        Returns:
+            (np.ndarray): code of voted intent for every query
+            (np.ndarray): whether every query is fallback or not
+            (np.ndarray): highest similarity of each intent for every query,
+                shape of (number of queries, number of labels), -inf for not voted intents
+        """
+
+        num_queries, topk = indices.shape
+        num_labels = len(self.dataset.labels)
+
+        found = indices != -1
+        rows, ranks = np.nonzero(found)
+        codes = self.dataset.intent_codes(indices[found]).astype(np.int64)
+        cells = rows * num_labels + codes
+
+        weights = dists[found] if voting == "soft" else np.ones(len(cells))
+        scores = np.bincount(cells, weights=weights, minlength=num_queries * num_labels)
+        scores = scores.reshape(num_queries, num_labels)
+
+        best = np.full(num_queries * num_labels, -np.inf, dtype=np.float32)
+        np.maximum.at(best, cells, dists[found])
+        best = best.reshape(num_queries, num_labels)
+
+        first = np.full(num_queries * num_labels, topk, dtype=np.int64)
+        np.minimum.at(first, cells, ranks)
+        first = first.reshape(num_queries, num_labels)
+
+        # ties of score are broken by the most similar neighbor,
+        # and then by the rank of the first neighbor.
+        voted = first < topk
+        scores = np.where(voted, scores, -np.inf)
+        tied = scores >= scores.max(axis=1, keepdims=True) - 1e-6
+        key = np.where(tied, best, -np.inf)
+        tied &= key == key.max(axis=1, keepdims=True)
+        winners = np.where(tied, first, topk).argmin(axis=1)
+
+        max_dists = best.max(axis=1) if num_labels != 0 else np.full(num_queries, -np.inf)
+        is_fallback = ~found.any(axis=1) | (max_dists < self.fallback_threshold)
+
+        return winners, is_fallback, best
+
+    def compact(self) -> None:
+        """
+        Retrain the index with remaining data to reclaim the space of removed data.
+        Ids of remaining data are kept.
+
+        Examples:
+            >>> retriever = IntentRetriever()
+            >>> retriever.compact()
+        """
+
+        with self.lock:
+            self._rebuild()
+
+    def _apply(self, op: str, *args) -> None:
+        """
+        Apply a mutation to dataset and index.
+        It is used for both new mutations and replaying the log.
+
+        Args:
+            op (str): one of ['add', 'remove', 'clear']
+            args: arguments of the mutation
+        """
+
+        if op == "add":
+            ids, sentences, vectors, intents = args
+            for i, (sentence, intent) in enumerate(zip(sentences, intents)):
+                self.lookup[(sentence, intent)] = int(ids[i])
+                self.dataset[int(ids[i])] = (sentence, vectors[i:i + 1], intent)
+
+            self.next_id = max(self.next_id, int(ids[-1]) + 1)
+            ntotal = self.index.ntotal + len(vectors)
+            if self.index_policy.need_rebuild(self.index, ntotal, self.trained_ntotal):
+                self._rebuild()
+            else:
+                self.index.add_with_ids(vectors, ids)
+
+        elif op == "remove":
+            ids, = args
+            # lookup must be built before popping data when it is replayed after loading.
+            lookup = self.lookup
+            for _id in ids:
+                sentence, _, intent = self.dataset.pop(int(_id))
+                del lookup[(sentence, intent)]
+
+            self.index.remove_ids(ids)
+            self.removed_ntotal += len(ids)
+
+            # removing from flat index already reclaims the space.
+            if IndexPolicy.kind_of(self.index) != "flat" and \
+                    self.removed_ntotal >= self.trained_ntotal * self.compact_ratio:
+                self._rebuild()
+
+        elif op == "clear":
+            self.dataset = IntentDataset(self.dim, self.vector_dtype)
+            self._lookup = {}
+            self.next_id = 0
+            self.index = self._build(0)
+            self.trained_ntotal = 0
+            self.removed_ntotal = 0
+
+        else:
+            raise Exception(f"wrong mutation: {op}")
+
+    def _maybe_checkpoint(self, force: bool = False) -> None:
+        """
+        Start writing checkpoint in the background
+        if enough mutations have been logged since the last checkpoint.
+
+        Args:
+            force (bool): start writing checkpoint regardless of number of mutations
+        """
+
+        if self._checkpoint_thread is not None and not self._checkpoint_thread.is_alive():
+            self._rebase()
+
+        if not force and not self.storage.need_checkpoint():
+            return
+
+        if self._checkpoint_thread is not None:
+            if not force and self._checkpoint_thread.is_alive():
+                return
+            self._checkpoint_thread.join()
+            self._rebase()
+
+        generation = self.storage.rotate()
+        self._checkpoint_thread = threading.Thread(
+            target=self._write_checkpoint,
+            args=(generation, faiss.clone_index(self.index), self.dataset.snapshot()),
+            daemon=True,
+        )
+        self._checkpoint_thread.start()
+
+    def _write_checkpoint(self, *args) -> None:
+        """
+        Write checkpoint in the background thread.
+        The exception is kept to be raised by `checkpoint`, because exceptions
+        of threads are not propagated. Log segments after the last complete checkpoint
+        are not removed, so they are replayed if the checkpoint has failed.
+
+        Args:
+            args: arguments of `RetrieverStorage.checkpoint`
+        """
+
+        generation, _, snapshot = args
+        try:
+            self.storage.checkpoint(*args)
+            self._checkpointed = (snapshot, self.storage.load_dataset(generation))
+        except Exception as e:
+            self._checkpoint_error = e
+            warnings.warn(f"failed to write checkpoint in the background: {e}")
+
+    def _rebase(self) -> None:
+        """
+        Read dataset from memory-mapped columns of the last checkpoint,
+        so data added before it do not stay in memory one by one.
+        It is called with the lock after the checkpoint thread is finished.
+        """
+
+        if self._checkpointed is not None:
+            snapshot, saved = self._checkpointed
+            self._checkpointed = None
+            self.dataset.rebase(snapshot, saved)
+
+    @property
+    def lookup(self) -> Dict[Tuple[str, str], int]:
+        """
+        Hash index from (sentence, intent) to id of index.
+        It is rebuilt from dataset when it is accessed for the first time
+        after loading dataset.
+
+        Returns:
+            (Dict[Tuple[str, str], int]): (sentence, intent) -> id of index
+        """
+
+        if self._lookup is None:
+            self._lookup = {
+                (sentence, intent): i
+                for i, (sentence, _, intent) in self.dataset.items()
+            }
+
+        return self._lookup
+
+    def _rebuild(self) -> None:
+        """
+        Create new index chosen by `index_policy` for the number of data,
+        and add every vectors in dataset after training it.
+        """
+
+        ids, vectors = self.dataset.matrix()
+        self.index = self._build(len(ids))
+        self.trained_ntotal = 0
+        self.removed_ntotal = 0
+
+        if len(ids) == 0:
+            return
+
+        self.index.train(vectors)
+        assert self.index.is_trained
+
+        self.index.add_with_ids(vectors, ids)
+        self.trained_ntotal = self.index.ntotal
+
+    def _build(self, ntotal: int) -> "faiss.Index":
+        """
+        Args:
+            ntotal (int): number of data
 
         Returns:
-            (np.ndarray): vector from input sentence
+            (faiss.Index): new empty index chosen by `index_policy` with `compression`
         """
 
-        vector = self.model.encode(text)
+        return self.index_policy.build(self.dim, ntotal, self.compression)
+
+    def _vectorize(
+        self,
+        text: Union[str, List[str]],
+        use_cache: bool = True,
+    ) -> np.ndarray:
+        """
+        Create vectors from input sentences.
+        list of sentences is encoded in batches of `batch_size`,
+        and only sentences not found in `cache` are encoded.
+
+        Args:
+            text (Union[str, List[str]]): input sentence or list of sentences
+            use_cache (bool): whether to use `cache` or not
+
+        Returns:
+            (np.ndarray): L2 normalized vectors of shape (number of sentences, dim)
+        """
+
+        texts = [text] if isinstance(text, str) else list(text)
+        if not use_cache:
+            return self._encode(texts)
+
+        cached = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if len(missing) == 0:
+            return np.stack(cached).reshape(-1, self.dim)
+
+        # sentences with the same key of cache are encoded once.
+        # normalized keys are not encoded, so vectors are same with those without cache.
+        keys = {i: self.cache.normalize(texts[i]) for i in missing}
+        first: Dict[str, str] = {}
+        for i in missing:
+            first.setdefault(keys[i], texts[i])
+
+        unique = list(first.values())
+        encoded = self._encode(unique)
+        self.cache.put_many(self.model_name, unique, encoded)
+
+        positions = {key: i for i, key in enumerate(first)}
+        for i in missing:
+            cached[i] = encoded[positions[keys[i]]]
+
+        return np.stack(cached).reshape(-1, self.dim)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Args:
+            texts (List[str]): input sentences
+
+        Returns:
+            (np.ndarray): L2 normalized vectors of shape (number of sentences, dim)
+        """
+
+        if self.scheduler is not None and len(texts) != 0:
+            vector = np.stack(self.scheduler.map(texts))
+        else:
+            vector = self.model.encode(texts, batch_size=self.batch_size)
+
         vector = np.array(vector, dtype=np.float32)
-        vector = vector.reshape(1, -1)
+        vector = vector.reshape(-1, self.dim)
         faiss.normalize_L2(vector)
 
         return vector
@@ -0,0 +1,277 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import json
+import glob
+import zlib
+import struct
+import pickle
+import contextlib
+from typing import Any, Iterator, List, Optional, Tuple
+
+import faiss
+
+from dialobot.core.intent.dataset import IntentDataset
+
+_HEADER = struct.Struct("<II")  # (length, crc32) of each record
+
+
+class RetrieverStorage:
+
+    def __init__(
+        self,
+        idx_path: str,
+        idx_file: str,
+        dataset_file: str,
+        checkpoint_interval: int = 1000,
+    ) -> None:
+        """
+        Append-only persistence for IntentRetriever.
+
+        Every mutation is appended to a log segment as a single record,
+        and the whole state is written as a checkpoint only periodically.
+        A checkpoint `g` is `{idx_file}.{g}` and columns of `IntentDataset`
+        whose names start with `{dataset_file without extension}.{g}`.
+        It contains every mutation before log segment `{idx_file}.log.{g}`.
+        The manifest `{idx_file}.manifest` points to the latest complete checkpoint.
+        It is replaced atomically after the checkpoint files are written,
+        so a crash at any moment leaves a consistent checkpoint and log.
+
+        Args:
+            idx_path (str): path to save dataset
+            idx_file (str): file name of trained faiss
+            dataset_file (str): file name of dataset
+            checkpoint_interval (int): number of log records to write a new checkpoint
+
+        Note:
+            If there is no manifest, `idx_file` and pickled `dataset_file`
+            of previous versions are loaded as the checkpoint 0.
+        """
+
+        self.idx_path = idx_path
+        self.idx_file = idx_file
+        self.dataset_file = dataset_file
+        self.checkpoint_interval = checkpoint_interval
+
+        os.makedirs(idx_path, exist_ok=True)
+        self.manifest = os.path.join(idx_path, f"{idx_file}.manifest")
+        self.generation = self._read_manifest()
+        # log segment currently written
+        self.segment = max([self.generation] + self._segments())
+        self.num_records = 0
+        self._fp = None
+
+    def load(self) -> Tuple[Optional[faiss.Index], Optional[Any], Iterator[Tuple]]:
+        """
+        Load the latest checkpoint and the log records after it.
+
+        Returns:
+            (Optional[faiss.Index]): index of checkpoint
+            (Optional[Any]): dataset of checkpoint.
+                `IntentDataset` or rows of previous versions
+            (Iterator[Tuple]): log records to replay on top of the checkpoint
+        """
+
+        idx_file = self._idx_file(self.generation)
+        index, dataset = None, None
+
+        if os.path.exists(idx_file):
+            index = faiss.read_index(idx_file)
+
+        if self.generation != 0:
+            dataset = IntentDataset.load(self._dataset_prefix(self.generation))
+        elif os.path.exists(os.path.join(self.idx_path, self.dataset_file)):
+            with open(os.path.join(self.idx_path, self.dataset_file), mode="rb") as f:
+                dataset = pickle.load(f)
+
+        return index, dataset, self._replay()
+
+    def append(self, *record) -> None:
+        """
+        Append a mutation record to the current log segment.
+
+        Args:
+            record (Tuple): mutation record. e.g. ("add", ids, sentences, vectors, intents)
+        """
+
+        payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        if self._fp is None:
+            self._fp = open(self._segment_file(self.segment), mode="ab")
+
+        self._fp.write(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self.num_records += 1
+
+    def need_checkpoint(self) -> bool:
+        """
+        Returns:
+            (bool): whether enough records have been appended since the last checkpoint
+        """
+
+        return self.num_records >= self.checkpoint_interval
+
+    def rotate(self) -> int:
+        """
+        Start new log segment. the state at this moment will be the next checkpoint.
+        Must be called while no mutation is in progress.
+
+        Returns:
+            (int): generation of the next checkpoint
+        """
+
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+        self.segment += 1
+        self.num_records = 0
+        return self.segment
+
+    def checkpoint(
+        self,
+        generation: int,
+        index: faiss.Index,
+        dataset: IntentDataset,
+    ) -> None:
+        """
+        Write checkpoint and remove files superseded by it.
+
+        Args:
+            generation (int): generation returned by `rotate`
+            index (faiss.Index): snapshot of index at the rotation
+            dataset (IntentDataset): snapshot of dataset at the rotation
+        """
+
+        # files of uncommitted generation are never read,
+        # so they can be written in place.
+        idx_file = self._idx_file(generation)
+        faiss.write_index(index, idx_file)
+        self._fsync(idx_file)
+        dataset.save(self._dataset_prefix(generation))
+
+        with open(self.manifest + ".tmp", mode="w") as f:
+            json.dump({"generation": generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.manifest + ".tmp", self.manifest)
+
+        previous, self.generation = self.generation, generation
+        for g in range(previous, generation):
+            for file in self._checkpoint_files(g):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(file)
+
+        for g in self._segments():
+            if g < generation:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._segment_file(g))
+
+    def load_dataset(self, generation: int) -> Optional[IntentDataset]:
+        """
+        Args:
+            generation (int): generation of checkpoint
+
+        Returns:
+            (Optional[IntentDataset]): memory-mapped dataset written by `checkpoint`
+        """
+
+        return IntentDataset.load(self._dataset_prefix(generation))
+
+    def close(self) -> None:
+        """
+        Close the current log segment.
+        """
+
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _replay(self) -> Iterator[Tuple]:
+        """
+        Read log records of the segments after the latest checkpoint.
+        A torn record at the end of a segment, which is left by a crash
+        while appending, is truncated.
+
+        Returns:
+            (Iterator[Tuple]): log records
+        """
+
+        for g in self._segments():
+            if g < self.generation:
+                continue
+
+            with open(self._segment_file(g), mode="r+b") as f:
+                offset = 0
+                while True:
+                    header = f.read(_HEADER.size)
+                    if len(header) < _HEADER.size:
+                        break
+
+                    length, crc = _HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        break
+
+                    offset = f.tell()
+                    self.num_records += 1
+                    yield pickle.loads(payload)
+
+                f.truncate(offset)
+
+    def _read_manifest(self) -> int:
+        if not os.path.exists(self.manifest):
+            return 0
+
+        with open(self.manifest) as f:
+            return json.load(f)["generation"]
+
+    def _checkpoint_files(self, generation: int) -> List[str]:
+        if generation == 0:
+            return [
+                os.path.join(self.idx_path, self.idx_file),
+                os.path.join(self.idx_path, self.dataset_file),
+            ]
+
+        return [self._idx_file(generation)] + \
+            IntentDataset.files(self._dataset_prefix(generation))
+
+    def _idx_file(self, generation: int) -> str:
+        if generation == 0:
+            return os.path.join(self.idx_path, self.idx_file)
+        return os.path.join(self.idx_path, f"{self.idx_file}.{generation}")
+
+    def _dataset_prefix(self, generation: int) -> str:
+        stem = os.path.splitext(self.dataset_file)[0]
+        return os.path.join(self.idx_path, f"{stem}.{generation}")
+
+    def _segment_file(self, generation: int) -> str:
+        return os.path.join(self.idx_path, f"{self.idx_file}.log.{generation}")
+
+    def _segments(self) -> List[int]:
+        pattern = os.path.join(glob.escape(self.idx_path), f"{glob.escape(self.idx_file)}.log.*")
+        segments = []
+        for file in glob.glob(pattern):
+            suffix = file.rsplit(".", 1)[-1]
+            if re.fullmatch(r"\d+", suffix):
+                segments.append(int(suffix))
+
+        return sorted(segments)
+
+    @staticmethod
+    def _fsync(file: str) -> None:
+        with open(file, mode="rb") as f:
+            os.fsync(f.fileno())
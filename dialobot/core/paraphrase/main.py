@@ -1,5 +1,7 @@
 from asian_bart import AsianBartTokenizer, AsianBartForConditionalGeneration
 import torch.nn as nn
+from typing import Any, Dict, List, Optional
+from dialobot.core.utils.scheduler import MicroBatchScheduler
 
 """
 Examples:
@@ -14,7 +16,7 @@ class Paraphrase(nn.Module):
     """
     model
     """
-    def __init__(self, lang: str, device = "cpu") -> None:
+    def __init__(self, lang: str, device = "cpu", batching: Optional[Dict[str, Any]] = None) -> None:
         self.model = AsianBartForConditionalGeneration.from_pretrained("model_name").to(device)
         self.tokenizer = AsianBartTokenizer.from_pretrained("hyunwoongko/asian-bart-ecjk")
         if lang == "ko":
@@ -26,14 +28,33 @@ class Paraphrase(nn.Module):
         else :
             raise NotImplementedError(f"wrong language code : {lang}")
 
+        # sentences of concurrent requests are generated together with `batching`.
+        # (arguments of `MicroBatchScheduler`)
+        self.scheduler = None
+        if batching is not None:
+            self.scheduler = MicroBatchScheduler(
+                self._generate,
+                name="dialobot-paraphrase-scheduler",
+                **batching,
+            )
+
     def generate(self, user_input: str):
+        if self.scheduler is not None:
+            result = self.scheduler.submit(user_input).result()
+        else:
+            result = self._generate([user_input])[0]
+
+        return result
+
+    def _generate(self, user_inputs: List[str]) -> List[str]:
         inputs = self.tokenizer.prepare_seq2seq_batch(
-            src_texts=user_input, src_langs=self.lang_code
+            src_texts=user_inputs, src_langs=self.lang_code
         )
         gen_token = self.model.generate(
             **inputs, forced_bos_token_id=self.tokenizer.lang_code_to_id[self.lang_code]
         )
 
-        print(
-            f"result : {self.tokenizer.decode(gen_token[0][2:], skip_special_tokens=True)}"
-        )
+        return [
+            self.tokenizer.decode(tokens[2:], skip_special_tokens=True)
+            for tokens in gen_token
+        ]
@@ -14,5 +14,7 @@
 
 from dialobot.core.utils.tokenizer import BrainBertTokenizer
 from dialobot.core.utils.const import LANGUAGE_ALIAS
+from dialobot.core.utils.cache import EmbeddingCache
+from dialobot.core.utils.scheduler import MicroBatchScheduler
 
-__all__ = [BrainBertTokenizer, LANGUAGE_ALIAS]
+__all__ = [BrainBertTokenizer, LANGUAGE_ALIAS, EmbeddingCache, MicroBatchScheduler]
@@ -0,0 +1,231 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from typing import List, Optional
+
+import numpy as np
+import torch
+from transformers import RobertaConfig, RobertaForSequenceClassification
+from transformers.modeling_outputs import SequenceClassifierOutput
+
+BACKENDS = ["torch", "onnx"]
+
+ONNX_PATH = os.path.join(os.path.expanduser('~'), ".dialobot", "onnx/")
+
+
+def _session(file: str, num_threads: Optional[int] = None):
+    try:
+        import onnxruntime
+    except ImportError:
+        raise ImportError(
+            "Can not import `onnxruntime`, please install package using below instructions.\n"
+            "- CPU user: `pip install onnxruntime`\n"
+            "- GPU user: `pip install onnxruntime-gpu`\n")
+
+    options = onnxruntime.SessionOptions()
+    if num_threads is not None:
+        options.intra_op_num_threads = num_threads
+
+    return onnxruntime.InferenceSession(file, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _export(module: torch.nn.Module, file: str, output_name: str) -> None:
+    """
+    Export module whose inputs are `input_ids` and `attention_mask`
+    with dynamic batch and sequence axes.
+    """
+
+    # exported to a temporary directory first, because weights can be saved
+    # as external data files which are referenced by name from the graph.
+    export_path = file + ".export"
+    os.makedirs(export_path, exist_ok=True)
+    export_file = os.path.join(export_path, os.path.basename(file))
+
+    # padded dummy inputs not to specialize the graph for unpadded inputs
+    input_ids = torch.full((2, 8), 5, dtype=torch.long)
+    attention_mask = torch.ones((2, 8), dtype=torch.long)
+    attention_mask[1, 4:] = 0
+    axes = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            module.eval(),
+            (input_ids, attention_mask),
+            export_file,
+            input_names=["input_ids", "attention_mask"],
+            output_names=[output_name],
+            dynamic_axes={
+                "input_ids": axes,
+                "attention_mask": axes,
+                output_name: {0: "batch"},
+            },
+            opset_version=14,
+        )
+
+    # the graph is moved last, so it exists only when every file is complete.
+    for name in os.listdir(export_path):
+        if name != os.path.basename(file):
+            os.replace(os.path.join(export_path, name), os.path.join(os.path.dirname(file), name))
+
+    os.replace(export_file, file)
+    os.rmdir(export_path)
+
+
+def _onnx_file(model_name: str, cache_path: str) -> str:
+    return os.path.join(cache_path, model_name.replace("/", "--") + ".onnx")
+
+
+class _Logits(torch.nn.Module):
+
+    def __init__(self, model: RobertaForSequenceClassification):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+class _SentenceEmbedding(torch.nn.Module):
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        features = {"input_ids": input_ids, "attention_mask": attention_mask}
+        return self.model(features)["sentence_embedding"]
+
+
+class OnnxNliModel:
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_path: str = ONNX_PATH,
+        num_threads: Optional[int] = None,
+    ) -> None:
+        """
+        RoBERTa NLI model running on ONNX Runtime.
+        It is called like `RobertaForSequenceClassification`.
+
+        Args:
+            model_name (str): model name of huggingface hub
+            cache_path (str): path to save exported models
+            num_threads (Optional[int]): number of intra-op threads of the session.
+                default of ONNX Runtime is used if it is None.
+
+        Note:
+            The model is exported to `cache_path` when it is loaded for the first time.
+
+        Examples:
+            >>> model = OnnxNliModel("hyunwoongko/roberta-base-en-mnli")
+            >>> model(input_ids=input_ids, attention_mask=attention_mask).logits
+        """
+
+        self.config = RobertaConfig.from_pretrained(model_name)
+        file = _onnx_file(model_name, cache_path)
+
+        if not os.path.exists(file):
+            model = RobertaForSequenceClassification.from_pretrained(model_name)
+            _export(_Logits(model), file, "logits")
+
+        self.session = _session(file, num_threads)
+
+    def __call__(self, input_ids=None, attention_mask=None, **kwargs) -> SequenceClassifierOutput:
+        # `token_type_ids` of single sentences are all zero, which is the default of the model.
+        input_ids = torch.as_tensor(input_ids).long()
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+
+        logits, = self.session.run(["logits"], {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": torch.as_tensor(attention_mask).long().cpu().numpy(),
+        })
+
+        return SequenceClassifierOutput(logits=torch.from_numpy(logits))
+
+    def eval(self) -> "OnnxNliModel":
+        return self
+
+    def to(self, device) -> "OnnxNliModel":
+        return self
+
+
+class OnnxSentenceEncoder:
+
+    def __init__(
+        self,
+        model,
+        model_name: str,
+        cache_path: str = ONNX_PATH,
+        num_threads: Optional[int] = None,
+    ) -> None:
+        """
+        SentenceTransformer encoder running on ONNX Runtime.
+        Sentences are tokenized by the SentenceTransformer.
+
+        Args:
+            model (SentenceTransformer): sentence transformer to export
+            model_name (str): model name for sentence transformers
+            cache_path (str): path to save exported models
+            num_threads (Optional[int]): number of intra-op threads of the session.
+                default of ONNX Runtime is used if it is None.
+
+        Examples:
+            >>> encoder = OnnxSentenceEncoder(SentenceTransformer(model_name), model_name)
+            >>> encoder.encode(["Hello", "Tell me today's weather"], batch_size=32)
+        """
+
+        self.tokenize = model.tokenize
+        self.dim = model.get_sentence_embedding_dimension()
+        file = _onnx_file(f"sentence-transformers/{model_name}", cache_path)
+
+        if not os.path.exists(file):
+            _export(_SentenceEmbedding(model.to("cpu")), file, "sentence_embedding")
+
+        self.session = _session(file, num_threads)
+
+    def encode(self, sentences: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Args:
+            sentences (List[str]): input sentences
+            batch_size (int): batch size for sentence encoding
+
+        Returns:
+            (np.ndarray): embeddings of shape (number of sentences, dim)
+        """
+
+        if isinstance(sentences, str):
+            sentences = [sentences]
+
+        if len(sentences) == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+
+        # sentences of similar length are encoded together like SentenceTransformer
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        embeddings = [None] * len(sentences)
+
+        for begin in range(0, len(order), batch_size):
+            batch = order[begin:begin + batch_size]
+            features = self.tokenize([sentences[i] for i in batch])
+            outputs, = self.session.run(["sentence_embedding"], {
+                "input_ids": features["input_ids"].long().numpy(),
+                "attention_mask": features["attention_mask"].long().numpy(),
+            })
+
+            for i, output in zip(batch, outputs):
+                embeddings[i] = output
+
+        return np.stack(embeddings).astype(np.float32)
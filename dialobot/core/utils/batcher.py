@@ -0,0 +1,117 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class AsyncBatcher:
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        max_batch: int = 32,
+        num_workers: int = 1,
+    ) -> None:
+        """
+        Coalesce concurrent coroutine calls into batches run on a thread pool.
+
+        While a batch is running in the thread pool, items submitted by other
+        callers are queued, and they are run together as the next batch.
+        Items whose callers have been cancelled are dropped before they run.
+
+        Args:
+            fn (Callable[[List[Any]], List[Any]]): function which processes a batch of items.
+                it returns a result for each item, and an exception instance as the result
+                is raised to the caller of the item only.
+            max_batch (int): maximum number of items in a batch
+            num_workers (int): number of threads to run batches
+
+        Examples:
+            >>> batcher = AsyncBatcher(lambda texts: retriever.recognize_batch(texts))
+            >>> await asyncio.gather(*[batcher.submit(text) for text in texts])
+        """
+
+        assert max_batch > 0, "param `max_batch` must be positive"
+        self.fn = fn
+        self.max_batch = max_batch
+        self.num_workers = num_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=num_workers,
+            thread_name_prefix="dialobot-async",
+        )
+
+        self._queue: List[Tuple[Any, asyncio.Future]] = []
+        self._num_running = 0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Args:
+            item (Any): item to process
+
+        Returns:
+            (Any): result of the item
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((item, future))
+
+        if self._num_running < self.num_workers:
+            self._num_running += 1
+            loop.create_task(self._drain(loop))
+
+        return await future
+
+    def close(self) -> None:
+        """
+        Shut down the thread pool after running batches are finished.
+        """
+
+        self.executor.shutdown(wait=True)
+
+    async def _drain(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+
+                items = [item for item, _ in batch]
+                try:
+                    results = await loop.run_in_executor(self.executor, self.fn, items)
+                except Exception as e:
+                    results = [e] * len(batch)
+
+                for (_, future), result in zip(batch, results):
+                    if future.done():
+                        # cancelled while running, the result is discarded.
+                        continue
+
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._num_running -= 1
+
+    def _next_batch(self) -> Optional[List[Tuple[Any, asyncio.Future]]]:
+        # cancelled callers are dropped here, so their items never run.
+        self._queue = [(item, future) for item, future in self._queue if not future.done()]
+        if len(self._queue) == 0:
+            return None
+
+        batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+        return batch
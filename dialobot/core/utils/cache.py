@@ -0,0 +1,268 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class LRUCache:
+
+    # name of sqlite table, and names of its key and value columns.
+    table: str = ""
+    key_columns: Tuple[str, ...] = ()
+    value_columns: Tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+    ) -> None:
+        """
+        Base of thread-safe LRU caches, optionally backed by a sqlite file.
+
+        Subclasses define the sqlite table and convert values to and from its rows
+        with `_dump` and `_load`. Keys are tuples of strings and integers.
+
+        Args:
+            maxsize (int): maximum number of values in memory. caching is disabled if it is 0.
+            ttl (Optional[float]): seconds until a value expires. never expires if it is None.
+            path (Optional[str]): path of sqlite file to keep values on disk.
+                values evicted from memory are read from it, and it survives restarts.
+        """
+
+        assert maxsize >= 0, "param `maxsize` must be non-negative"
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = os.path.expanduser(path) if path is not None else None
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._lock = threading.Lock()
+        # key -> (value, expiration time)
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float]]" = OrderedDict()
+        self._db = None
+
+        if self.path is not None:
+            columns = ", ".join(self.key_columns + self.value_columns)
+            keys = ", ".join(self.key_columns)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f"{columns}, expires REAL, PRIMARY KEY ({keys}))"
+            )
+            self._db.execute(f"DELETE FROM {self.table} WHERE expires < ?", (time.time(),))
+            self._db.commit()
+
+    def clear(self) -> None:
+        """
+        Remove every value in memory and on disk, and reset counters.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = 0
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table}")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            (Dict[str, int]): number of hits, misses, hits from disk and values in memory
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "size": len(self._entries),
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get_many(self, keys: List[Tuple]) -> List[Optional[Any]]:
+        if self.maxsize == 0:
+            return [None] * len(keys)
+
+        now = time.time()
+        values: List[Optional[Any]] = [None] * len(keys)
+        missing: Dict[Tuple, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    entry = None
+
+                if entry is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self._entries.move_to_end(key)
+                    values[i] = entry[0]
+
+            if self._db is not None and len(missing) != 0:
+                for key, value, expires in self._read(list(missing), now):
+                    self._insert(key, value, expires)
+                    for i in missing.pop(key):
+                        values[i] = value
+                        self.disk_hits += 1
+
+            num_missing = sum(len(positions) for positions in missing.values())
+            self.misses += num_missing
+            self.hits += len(keys) - num_missing
+
+        return values
+
+    def _put_many(self, items: List[Tuple[Tuple, Any]]) -> None:
+        if self.maxsize == 0 or len(items) == 0:
+            return
+
+        expires = time.time() + self.ttl if self.ttl is not None else float("inf")
+        rows = []
+
+        with self._lock:
+            for key, value in items:
+                self._insert(key, value, expires)
+                rows.append((*key, *self._dump(value), expires))
+
+            if self._db is not None:
+                placeholders = ", ".join(["?"] * (len(self.key_columns) + len(self.value_columns) + 1))
+                self._db.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} VALUES ({placeholders})", rows)
+                self._db.commit()
+
+    def _insert(self, key: Tuple, value: Any, expires: float) -> None:
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _read(self, keys: List[Tuple], now: float) -> List[Tuple[Tuple, Any, float]]:
+        query = (
+            f"SELECT {', '.join(self.value_columns)}, expires FROM {self.table} WHERE "
+            + " AND ".join(f"{column} = ?" for column in self.key_columns)
+        )
+
+        found = []
+        for key in keys:
+            row = self._db.execute(query, key).fetchone()
+            if row is None or row[-1] < now:
+                continue
+
+            found.append((key, self._load(row[:-1]), row[-1]))
+
+        return found
+
+    def _dump(self, value: Any) -> Tuple:
+        raise NotImplementedError
+
+    def _load(self, row: Tuple) -> Any:
+        raise NotImplementedError
+
+
+class EmbeddingCache(LRUCache):
+
+    table = "embeddings"
+    key_columns = ("model", "text")
+    value_columns = ("vector",)
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+    ) -> None:
+        """
+        Thread-safe LRU cache of sentence embeddings.
+
+        Sentences are normalized (NFKC, collapsed whitespaces) and cached
+        with the name of the model which encoded them.
+        The least recently used embedding is evicted when the cache is full.
+
+        Args:
+            maxsize (int): maximum number of embeddings in memory. caching is disabled if it is 0.
+            ttl (Optional[float]): seconds until an embedding expires. never expires if it is None.
+            path (Optional[str]): path of sqlite file to keep embeddings on disk.
+                embeddings evicted from memory are read from it, and it survives restarts.
+
+        Examples:
+            >>> cache = EmbeddingCache(maxsize=50000, ttl=3600, path="~/.dialobot/embedding.db")
+            >>> retriever = IntentRetriever(cache=cache)
+            >>> retriever.recognize("Hello")
+            >>> retriever.recognize(" Hello ")
+            >>> cache.stats()
+            {'hits': 1, 'misses': 1, 'disk_hits': 0, 'size': 1}
+        """
+
+        super().__init__(maxsize=maxsize, ttl=ttl, path=path)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Args:
+            text (str): input sentence
+
+        Returns:
+            (str): normalized sentence used as the key of cache
+        """
+
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Args:
+            model (str): name of the model which encodes sentences
+            texts (List[str]): input sentences
+
+        Returns:
+            (List[Optional[np.ndarray]]): cached embeddings, None for missing sentences
+        """
+
+        return self._get_many([(model, self.normalize(text)) for text in texts])
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Args:
+            model (str): name of the model which encoded sentences
+            texts (List[str]): input sentences
+            vectors (np.ndarray): embeddings of sentences, shape of (number of sentences, dim)
+        """
+
+        items = []
+        for text, vector in zip(texts, vectors):
+            vector = np.array(vector, dtype=np.float32)
+            vector.setflags(write=False)
+            items.append(((model, self.normalize(text)), vector))
+
+        self._put_many(items)
+
+    def _dump(self, value: np.ndarray) -> Tuple:
+        return (value.tobytes(),)
+
+    def _load(self, row: Tuple) -> np.ndarray:
+        return np.frombuffer(row[0], dtype=np.float32)
@@ -0,0 +1,185 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pickle
+import warnings
+from typing import List, Optional, Union
+
+import torch
+from transformers import RobertaConfig, RobertaForSequenceClassification
+
+from dialobot.core.utils.backend import BACKENDS, OnnxNliModel
+
+PRECISIONS = ["fp32", "int8-dynamic", "bf16"]
+
+
+def bf16_supported() -> bool:
+    """
+    Returns:
+        (bool): whether the CPU supports bfloat16 matmul natively
+    """
+
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def load_nli_model(
+    model_name: str,
+    device: str = "cpu",
+    precision: str = "fp32",
+    cache_path: str = os.path.join(
+        os.path.expanduser('~'),
+        ".dialobot",
+        "quantized/",
+    ),
+    backend: str = "torch",
+    num_threads: Optional[int] = None,
+) -> Union[RobertaForSequenceClassification, OnnxNliModel]:
+    """
+    Load RoBERTa NLI model with precision.
+
+    - fp32: original model
+    - int8-dynamic: weights of linear layers are quantized to int8,
+        and activations are quantized dynamically. (CPU only)
+    - bf16: bfloat16 model. fp32 is used if the CPU does not support bfloat16.
+
+    Args:
+        model_name (str): model name of huggingface hub
+        device (str): device to run model
+        precision (str): one of ['fp32', 'int8-dynamic', 'bf16']
+        cache_path (str): path to save quantized models
+        backend (str): inference backend, one of ['torch', 'onnx'].
+            onnx backend supports only fp32 precision on cpu.
+        num_threads (Optional[int]): number of intra-op threads of onnx backend.
+            default of ONNX Runtime is used if it is None.
+
+    Returns:
+        (Union[RobertaForSequenceClassification, OnnxNliModel]): model in evaluation mode
+
+    Note:
+        Config and quantized weights are saved in `cache_path` when the model is quantized
+        for the first time, and they are loaded without fp32 weights at later startups.
+        The file is loaded with `weights_only=True`, so it can not run code,
+        and an unreadable file is quantized again with a warning.
+
+    Examples:
+        >>> model = load_nli_model("hyunwoongko/roberta-base-en-mnli", precision="int8-dynamic")
+    """
+
+    assert precision in PRECISIONS, \
+        f"param `precision` must be one of {PRECISIONS}"
+    assert backend in BACKENDS, \
+        f"param `backend` must be one of {BACKENDS}"
+
+    if backend == "onnx":
+        assert precision == "fp32" and device == "cpu", \
+            "onnx backend is only available with fp32 precision on cpu."
+        return OnnxNliModel(model_name, num_threads=num_threads)
+
+    if precision == "int8-dynamic":
+        assert device == "cpu", "int8-dynamic precision is only available on cpu."
+        return _load_quantized(model_name, cache_path)
+
+    model = RobertaForSequenceClassification.from_pretrained(model_name)
+
+    if precision == "bf16":
+        if device == "cpu" and not bf16_supported():
+            warnings.warn("this CPU does not support bfloat16, fp32 is used instead.")
+        else:
+            model = model.to(torch.bfloat16)
+
+    return model.to(device).eval()
+
+
+def nli_probs(
+    model: Union[RobertaForSequenceClassification, OnnxNliModel],
+    input_ids: List[List[int]],
+    device: str = "cpu",
+    max_batch: Optional[int] = None,
+) -> torch.Tensor:
+    """
+    Score token ids of (premise, hypothesis) pairs in padded batches.
+    Pairs are sorted by length and split into batches of `max_batch`,
+    so pairs of similar length are padded together.
+
+    Args:
+        model (Union[RobertaForSequenceClassification, OnnxNliModel]): NLI model
+        input_ids (List[List[int]]): token ids of pairs
+        device (str): device of model
+        max_batch (Optional[int]): maximum number of pairs in a forward pass.
+            every pair is scored in a single forward pass if it is None.
+
+    Returns:
+        (torch.Tensor): probabilities of labels, shape of (number of pairs, number of labels)
+    """
+
+    pad_token_id = model.config.pad_token_id
+    order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+    max_batch = max_batch if max_batch else max(len(order), 1)
+    probs = torch.zeros(len(input_ids), model.config.num_labels)
+
+    with torch.inference_mode():
+        for begin in range(0, len(order), max_batch):
+            batch = order[begin:begin + max_batch]
+            max_length = max(len(input_ids[i]) for i in batch)
+            tokens = torch.full((len(batch), max_length), pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), max_length), dtype=torch.long)
+
+            for row, i in enumerate(batch):
+                tokens[row, :len(input_ids[i])] = torch.tensor(input_ids[i])
+                attention_mask[row, :len(input_ids[i])] = 1
+
+            logits = model(
+                input_ids=tokens.to(device),
+                attention_mask=attention_mask.to(device),
+            ).logits
+
+            probs[batch] = torch.softmax(logits.float(), dim=-1).cpu()
+
+    return probs
+
+
+def _load_quantized(model_name: str, cache_path: str) -> RobertaForSequenceClassification:
+    cache_file = os.path.join(
+        cache_path,
+        model_name.replace("/", "--") + ".int8-dynamic.pt",
+    )
+
+    if os.path.exists(cache_file):
+        # only config and tensors are saved, so the file is loaded without unpickling code.
+        # the structure is quantized from a randomly initialized model, and fp32 weights are not loaded.
+        try:
+            checkpoint = torch.load(cache_file, weights_only=True)
+            model = _quantize(RobertaForSequenceClassification(RobertaConfig.from_dict(checkpoint["config"])))
+            model.load_state_dict(checkpoint["state_dict"])
+            return model.eval()
+        except (pickle.UnpicklingError, RuntimeError, EOFError, KeyError, TypeError) as e:
+            warnings.warn(f"failed to load quantized model from {cache_file}, it is quantized again: {e}")
+
+    model = _quantize(RobertaForSequenceClassification.from_pretrained(model_name))
+    os.makedirs(cache_path, exist_ok=True)
+    torch.save({"config": model.config.to_dict(), "state_dict": model.state_dict()}, cache_file + ".tmp")
+    os.replace(cache_file + ".tmp", cache_file)
+    return model
+
+
+def _quantize(model: RobertaForSequenceClassification) -> RobertaForSequenceClassification:
+    return torch.quantization.quantize_dynamic(
+        model.eval(),
+        {torch.nn.Linear},
+        dtype=torch.qint8,
+    )
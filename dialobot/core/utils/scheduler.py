@@ -0,0 +1,240 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+
+class MicroBatchScheduler:
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        max_batch: int = 32,
+        max_wait: float = 5.0,
+        max_queue: int = 1024,
+        name: str = "dialobot-scheduler",
+    ) -> None:
+        """
+        Dynamic micro-batching scheduler shared by concurrent callers of a model.
+
+        Items submitted from any thread are queued, and a worker thread runs them
+        as a single batch when `max_batch` items are queued or the oldest item
+        has waited for `max_wait` milliseconds.
+
+        Args:
+            fn (Callable[[List[Any]], List[Any]]): function which processes a batch of items.
+                it returns a result for each item, and an exception instance as the result
+                is raised to the caller of the item only.
+            max_batch (int): maximum number of items in a batch
+            max_wait (float): maximum milliseconds to wait for more items before running a batch
+            max_queue (int): maximum number of queued items.
+                callers wait until the queue has space for their items,
+                and more items than `max_queue` are queued in chunks of `max_queue` items.
+            name (str): name of the worker thread
+
+        Examples:
+            >>> scheduler = MicroBatchScheduler(lambda texts: list(model.encode(texts)), max_wait=2)
+            >>> scheduler.map(["Hello", "Tell me today's weather"])
+            [array([...]), array([...])]
+            >>> scheduler.metrics()
+            {'submitted': 2, 'blocked': 0, 'closed_rejections': 0, 'completed': 2, 'failed': 0, 'batches': 1, ...}
+        """
+
+        assert max_batch > 0, "param `max_batch` must be positive"
+        assert max_wait >= 0, "param `max_wait` must be non-negative"
+        assert max_queue >= max_batch, "param `max_queue` must not be less than `max_batch`"
+
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+
+        self._cond = threading.Condition()
+        # (item, future, enqueued time)
+        self._queue: Deque[Tuple[Any, Future, float]] = deque()
+        self._closed = False
+        self._counters = {
+            "submitted": 0,
+            "blocked": 0,
+            "closed_rejections": 0,
+            "completed": 0,
+            "failed": 0,
+            "batches": 0,
+            "wait_time": 0.0,
+            "run_time": 0.0,
+        }
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """
+        Args:
+            item (Any): item to process
+
+        Returns:
+            (Future): future of the result of the item
+        """
+
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items: List[Any]) -> List[Future]:
+        """
+        Items up to `max_queue` are queued at once, so they are not split by items of other callers.
+        It blocks while the queue has no space for them.
+
+        Args:
+            items (List[Any]): items to process
+
+        Returns:
+            (List[Future]): future of the result of each item
+
+        Raises:
+            Raises exception when the scheduler is closed before every item is queued.
+        """
+
+        futures = [Future() for _ in items]
+        begin = 0
+
+        with self._cond:
+            while begin < len(items):
+                size = min(len(items) - begin, self.max_queue)
+                if not self._closed and len(self._queue) + size > self.max_queue:
+                    self._counters["blocked"] += size
+                while not self._closed and len(self._queue) + size > self.max_queue:
+                    self._cond.wait()
+
+                if self._closed:
+                    self._counters["closed_rejections"] += len(items) - begin
+                    raise Exception("scheduler is closed.")
+
+                now = time.monotonic()
+                self._queue.extend(
+                    (items[i], futures[i], now) for i in range(begin, begin + size))
+                self._counters["submitted"] += size
+                begin += size
+                self._cond.notify_all()
+
+        return futures
+
+    def map(self, items: List[Any]) -> List[Any]:
+        """
+        Submit items and wait for their results.
+
+        Args:
+            items (List[Any]): items to process
+
+        Returns:
+            (List[Any]): result of each item
+        """
+
+        return [future.result() for future in self.submit_many(items)]
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Returns:
+            (Dict[str, float]): number of submitted items, items which waited for space in the queue,
+                items rejected because the scheduler was closed, completed and failed items and batches,
+                current queue depth, mean batch size, mean milliseconds that items waited
+                in the queue and mean milliseconds to run a batch.
+        """
+
+        with self._cond:
+            counters = dict(self._counters)
+            queue_depth = len(self._queue)
+
+        processed = counters["completed"] + counters["failed"]
+        batches = counters.pop("batches")
+        wait_time = counters.pop("wait_time")
+        run_time = counters.pop("run_time")
+
+        return {
+            **counters,
+            "batches": batches,
+            "queue_depth": queue_depth,
+            "mean_batch_size": processed / batches if batches else 0.0,
+            "mean_wait_ms": wait_time * 1000 / processed if processed else 0.0,
+            "mean_run_ms": run_time * 1000 / batches if batches else 0.0,
+        }
+
+    def close(self) -> None:
+        """
+        Stop the worker thread after queued items are processed.
+        """
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        if self._worker is not threading.current_thread():
+            self._worker.join()
+
+    def _next_batch(self) -> List[Tuple[Any, Future, float]]:
+        with self._cond:
+            while len(self._queue) == 0 and not self._closed:
+                self._cond.wait()
+
+            # waiting time is measured from the oldest item in the queue.
+            if len(self._queue) != 0:
+                deadline = self._queue[0][2] + self.max_wait / 1000
+                while len(self._queue) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch)
+            batch = [self._queue.popleft() for _ in range(size)]
+            # wake up callers waiting for space in the queue.
+            self._cond.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if len(batch) == 0:
+                return
+
+            # cancelled callers are dropped here, so their items never run.
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if len(batch) == 0:
+                continue
+
+            start = time.monotonic()
+            try:
+                results = self.fn([item for item, _, _ in batch])
+                assert len(results) == len(batch), \
+                    f"{len(batch)} results are expected, but got {len(results)}"
+            except Exception as e:
+                results = [e] * len(batch)
+            end = time.monotonic()
+
+            failed = 0
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                    failed += 1
+                else:
+                    future.set_result(result)
+
+            with self._cond:
+                self._counters["completed"] += len(batch) - failed
+                self._counters["failed"] += failed
+                self._counters["batches"] += 1
+                self._counters["wait_time"] += sum(start - enqueued for _, _, enqueued in batch)
+                self._counters["run_time"] += end - start
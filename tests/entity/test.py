@@ -12,8 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import tempfile
 import unittest
-from dialobot.core.entity import Ner
+from unittest import mock
+
+from dialobot.core.entity import Ner, Gazetteer, EntityPrefilter, EntityMemo, analyzer
 
 
 class NERTester(unittest.TestCase):
@@ -37,4 +41,99 @@ class NERTester(unittest.TestCase):
         out = ner.recognize("请订购奶酪比萨。",
                             entities=["食物", "城市"])
         # entity = [e for e, s in [entity for word, entity in out if len(entity) > 1]]
-        # self.assertTrue("食物" in entity)
\ No newline at end of file
+        # self.assertTrue("食物" in entity)
+
+    def test_max_batch(self):
+        out = Ner(lang="en").recognize("please order Cheese Pizza in Seoul.",
+                                       entities=["FOOD", "CITY"])
+        batched = Ner(lang="en", max_batch=1).recognize("please order Cheese Pizza in Seoul.",
+                                                        entities=["FOOD", "CITY"])
+        self.assertTrue(out == batched)
+
+    def test_warmup(self):
+        ner = Ner(lang="zh")
+        tagger = analyzer.load("zh")
+        ner.warmup()
+        Ner(lang="zh")
+        self.assertTrue(analyzer.load("zh") is tagger)
+
+    def test_missing_resources(self):
+        with mock.patch.dict(analyzer._analyzers, clear=True), \
+                mock.patch.object(analyzer, "_missing_resources", return_value=["punkt_tab"]), \
+                mock.patch.object(analyzer, "download") as download:
+            with self.assertRaisesRegex(Exception, "punkt_tab"):
+                Ner(lang="en", download=False)
+            self.assertTrue(download.call_count == 0)
+
+    def test_gazetteer(self):
+        path = tempfile.mkdtemp()
+        gazetteer = Gazetteer(path=path)
+        gazetteer.add("FOOD", ["Cheese Pizza", "pasta"])
+        self.assertTrue(gazetteer.match("order CHEESE PIZZA") == [(6, 18, "FOOD")])
+
+        # words are matched at word boundaries, but CJK words are matched inside of sentence.
+        gazetteer.add_many({"FOOD": ["ice cream", "피자"], "CITY": "Seoul"})
+        self.assertTrue(gazetteer.match("rice cream and pastas") == [])
+        self.assertTrue(gazetteer.match("ice cream in Seoul.") == [(0, 9, "FOOD"), (13, 18, "CITY")])
+        self.assertTrue(gazetteer.match("치즈피자 주문") == [(2, 4, "FOOD")])
+        gazetteer.remove("FOOD", ["ice cream", "피자"])
+        gazetteer.remove("CITY")
+
+        ner = Ner(lang="en", gazetteer=Gazetteer(path=path))
+        out = ner.recognize("please order Cheese Pizza.", entities=["FOOD", "CITY"])
+        self.assertTrue(("Cheese Pizza", ("FOOD", 1.0)) in out)
+
+    def test_prefilter(self):
+        prefilter = EntityPrefilter(topk=2)
+        entities = ["FOOD", "CITY", "PERSON", "ANIMAL", "COLOR"]
+        candidates = prefilter.candidates(["pizza", "Seoul"], entities)
+        self.assertTrue(all(len(c) == 2 for c in candidates))
+        self.assertTrue(entities.index("FOOD") in candidates[0])
+
+        # case variants of an entity are pruned together.
+        variants = entities + [e.lower() for e in entities]
+        candidates = prefilter.candidates(["pizza"], variants)
+        self.assertTrue(len(candidates[0]) == 4)
+        self.assertTrue(len({variants[i].lower() for i in candidates[0]}) == 2)
+        self.assertTrue(variants[candidates[0][0]].lower() == "food")
+
+        ner = Ner(lang="en", prefilter=prefilter)
+        out = ner.recognize("please order Cheese Pizza.", entities=entities)
+        entity = [e for e, s in [entity for word, entity in out if len(entity) > 1]]
+        self.assertTrue("FOOD" in entity)
+
+    def test_recognize_batch(self):
+        texts = ["please order Cheese Pizza.", "I live in Seoul.", "please order Cheese Pizza."]
+        memo = EntityMemo()
+        ner = Ner(lang="en", memo=memo)
+        outs = ner.recognize_batch(texts, entities=["FOOD", "CITY"])
+
+        self.assertTrue(outs == [ner.recognize(text, entities=["FOOD", "CITY"]) for text in texts])
+        self.assertTrue(list(ner.recognize_iter(iter(texts), entities=["FOOD", "CITY"], batch_size=2)) == outs)
+        self.assertTrue(memo.stats()["misses"] == len(memo))
+
+    def test_memo(self):
+        path = tempfile.mkdtemp() + "/memo.db"
+        memo = EntityMemo(maxsize=1, path=path)
+        memo.put_many("nli", ["FOOD", "CITY"], {"pizza": ("FOOD", 0.9), "Seoul": ("CITY", 0.8)})
+
+        # results are keyed by entities regardless of order, and by `topk` of prefilter.
+        self.assertTrue(memo.get_many("nli", ["CITY", "FOOD"], ["pizza"]) == [("FOOD", 0.9)])
+        self.assertTrue(memo.get_many("nli", ["CITY", "FOOD"], ["pizza"], topk=1) == [None])
+        self.assertTrue(EntityMemo(path=path).get_many("nli", ["FOOD", "CITY"], ["Seoul"]) == [("CITY", 0.8)])
+        self.assertTrue(memo.stats()["disk_hits"] == 1)
+
+    def test_arecognize(self):
+        ner = Ner(lang="en")
+        texts = ["please order Cheese Pizza.", "I live in Seoul."] * 4
+
+        async def recognize():
+            return await asyncio.gather(*[ner.arecognize(text, entities=["FOOD", "CITY"]) for text in texts])
+
+        with mock.patch.object(ner, "recognize_batch", wraps=ner.recognize_batch) as recognize_batch:
+            outs = asyncio.run(recognize())
+
+        # coalesced items are recognized in batches, not one by one.
+        self.assertTrue(recognize_batch.call_count < len(texts))
+        self.assertTrue(outs == [ner.recognize(text, entities=["FOOD", "CITY"]) for text in texts])
+        ner.close()
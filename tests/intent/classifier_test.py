@@ -12,8 +12,56 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import os
+import tempfile
 import unittest
+import warnings
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from transformers import RobertaConfig, RobertaForSequenceClassification
+
 from dialobot.core.intent import IntentClassifier
+from dialobot.core.utils.model import load_nli_model, nli_probs
+
+
+class StubTokenizer:
+    """
+    Tokenizer which maps words to ids by hashing, not to download models in tests.
+    """
+
+    cls_token_id = 0
+    sep_token_id = 2
+
+    @classmethod
+    def from_pretrained(cls, *args, **kwargs):
+        return cls()
+
+    def __call__(self, text, add_special_tokens=True):
+        return {"input_ids": [int(hashlib.md5(w.encode()).hexdigest(), 16) % 100 + 3 for w in text.split()]}
+
+
+def tiny_nli_model():
+    torch.manual_seed(0)
+    config = RobertaConfig(
+        vocab_size=103,
+        hidden_size=16,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=64,
+        num_labels=3,
+        pad_token_id=1,
+    )
+    return RobertaForSequenceClassification(config).eval()
+
+
+def stub_classifier(**kwargs):
+    with mock.patch("dialobot.core.intent.classifier.RobertaTokenizer", StubTokenizer), \
+            mock.patch("dialobot.core.intent.classifier.load_nli_model", return_value=tiny_nli_model()):
+        return IntentClassifier(lang="en", **kwargs)
 
 
 class ClassifierTester(unittest.TestCase):
@@ -43,3 +91,116 @@ class ClassifierTester(unittest.TestCase):
         clf = IntentClassifier(lang="ko")
         out = clf.recognize("시간 알려줘", intents=["날씨", "식당"])
         self.assertTrue(out == "fallback")
+
+    def test_batching(self):
+        clf = IntentClassifier(lang="en", batching={"max_batch": 16, "max_wait": 20})
+        texts = ["Tell me today's weather", "Recommend a good restaurant"] * 4
+
+        with ThreadPoolExecutor(max_workers=len(texts)) as executor:
+            outs = list(executor.map(
+                lambda text: clf.recognize(text, intents=["weather", "restaurant"]), texts))
+
+        metrics = clf.scheduler.metrics()
+        clf.scheduler.close()
+        self.assertTrue(outs == ["weather", "restaurant"] * 4)
+        self.assertTrue(metrics["completed"] == 2 * len(texts))
+        self.assertTrue(metrics["batches"] < len(texts))
+
+
+class StubClassifierTest(unittest.TestCase):
+
+    intents = ["weather", "restaurant", "time", "music", "alarm"]
+
+    def test_single_forward(self):
+        clf = stub_classifier()
+        with mock.patch.object(clf.model, "forward", wraps=clf.model.forward) as forward:
+            probs = clf.entailment("Tell me today's weather", self.intents)
+        self.assertTrue(forward.call_count == 1)
+
+        # padding of batched pairs does not change the scores.
+        for intent, prob in zip(self.intents, probs):
+            self.assertTrue(torch.allclose(prob, clf.entailment("Tell me today's weather", [intent])[0], atol=1e-5))
+
+    def test_max_batch(self):
+        clf = stub_classifier(max_batch=2)
+        with mock.patch.object(clf.model, "forward", wraps=clf.model.forward) as forward:
+            probs = clf.entailment("Tell me today's weather", self.intents)
+        self.assertTrue(forward.call_count == 3)
+
+        clf.max_batch = None
+        self.assertTrue(torch.allclose(probs, clf.entailment("Tell me today's weather", self.intents), atol=1e-5))
+
+    def test_hypothesis_cache(self):
+        clf = stub_classifier()
+        clf.recognize("Tell me today's weather", intents=self.intents)
+
+        with mock.patch.object(clf, "encode", wraps=clf.encode) as encode:
+            clf.recognize("Recommend a good restaurant", intents=self.intents)
+            # only the sentence is tokenized with cached hypothesises.
+            self.assertTrue(encode.call_count == 1)
+
+            clf.recognize("Recommend a good restaurant", intents=["weather", "news"])
+            self.assertTrue(encode.call_count == 3)
+
+        # hypothesises of intents which are not requested anymore are dropped.
+        self.assertTrue(set(clf.hypothesis_cache) == {("en", "weather"), ("en", "news")})
+        self.assertTrue(clf.hypothesis_cache[("en", "news")] == clf.encode("This sentence is about news."))
+
+    def test_recognize_batch(self):
+        clf = stub_classifier()
+        texts = ["Tell me today's weather", "Recommend a good restaurant", "What time is it?"]
+
+        with mock.patch.object(clf.model, "forward", wraps=clf.model.forward) as forward:
+            outs = clf.recognize_batch(texts, intents=self.intents, detail=True)
+        self.assertTrue(forward.call_count == 1)
+
+        for text, out in zip(texts, outs):
+            expected = clf.recognize(text, intents=self.intents, detail=True)
+            self.assertTrue(out["intent"] == expected["intent"])
+            for intent in self.intents:
+                self.assertAlmostEqual(out["scores"][intent], expected["scores"][intent], places=4)
+
+
+class PrecisionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.input_ids = [[0, 5, 6, 7, 2, 2, 8, 9, 2], [0, 5, 2, 2, 8, 2]]
+        self.model = tiny_nli_model()
+        patcher = mock.patch.object(RobertaForSequenceClassification, "from_pretrained", return_value=self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_int8_dynamic(self):
+        cache_path = tempfile.mkdtemp()
+        model = load_nli_model("stub/roberta-nli", precision="int8-dynamic", cache_path=cache_path)
+        self.assertTrue(any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in model.modules()))
+
+        # quantized weights are loaded from cache without loading fp32 weights.
+        with mock.patch.object(RobertaForSequenceClassification, "from_pretrained") as from_pretrained:
+            cached = load_nli_model("stub/roberta-nli", precision="int8-dynamic", cache_path=cache_path)
+        self.assertTrue(from_pretrained.call_count == 0)
+        self.assertTrue(torch.equal(nli_probs(model, self.input_ids), nli_probs(cached, self.input_ids)))
+
+        # only tensors are loaded, so a pickled module is not executed but quantized again.
+        cache_file = os.path.join(cache_path, "stub--roberta-nli.int8-dynamic.pt")
+        torch.save(model, cache_file)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            model = load_nli_model("stub/roberta-nli", precision="int8-dynamic", cache_path=cache_path)
+        self.assertTrue(any("quantized again" in str(w.message) for w in caught))
+        self.assertTrue(torch.equal(nli_probs(model, self.input_ids), nli_probs(cached, self.input_ids)))
+
+    def test_bf16(self):
+        with mock.patch("dialobot.core.utils.model.bf16_supported", return_value=False):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                model = load_nli_model("stub/roberta-nli", precision="bf16")
+        self.assertTrue(len(caught) == 1)
+        self.assertTrue(next(model.parameters()).dtype == torch.float32)
+
+        with mock.patch("dialobot.core.utils.model.bf16_supported", return_value=True):
+            model = load_nli_model("stub/roberta-nli", precision="bf16")
+        self.assertTrue(next(model.parameters()).dtype == torch.bfloat16)
+        # probabilities are computed in float32.
+        self.assertTrue(nli_probs(model, self.input_ids).dtype == torch.float32)
+
@@ -0,0 +1,92 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+
+import faiss
+import numpy as np
+
+from dialobot.core.intent import IntentRetriever, IndexPolicy
+from tests.intent.storage_test import HashEncoder
+
+
+class IndexPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = IndexPolicy(flat_threshold=100, hnsw_threshold=1000, retrain_ratio=2.0)
+
+    def trained(self, ntotal, dim=16):
+        index = self.policy.build(dim, ntotal)
+        index.train(np.random.RandomState(0).rand(ntotal, dim).astype(np.float32))
+        return index
+
+    def test_kind(self):
+        self.assertTrue(self.policy.kind(0) == "flat")
+        self.assertTrue(self.policy.kind(99) == "flat")
+        self.assertTrue(self.policy.kind(100) == "ivf")
+        self.assertTrue(self.policy.kind(999) == "ivf")
+        self.assertTrue(self.policy.kind(1000) == "ivf_hnsw")
+
+        for ntotal in [10, 100, 1000]:
+            index = self.policy.build(16, ntotal)
+            self.assertTrue(IndexPolicy.kind_of(index) == self.policy.kind(ntotal))
+
+    def test_nlist(self):
+        # nlist_factor * sqrt(ntotal), with at least 39 data per cluster.
+        self.assertTrue(self.policy.nlist(1) == 1)
+        self.assertTrue(self.policy.nlist(100) == 2)
+        self.assertTrue(self.policy.nlist(10000) == 256)
+        self.assertTrue(self.policy.nlist(1000000) == 4000)
+
+    def test_configure(self):
+        policy = IndexPolicy(flat_threshold=100, hnsw_threshold=1000, nprobe=4, ef_search=2)
+        index = policy.build(16, 100000)
+        self.assertTrue(IndexPolicy.kind_of(index) == "ivf_hnsw")
+
+        ivf = faiss.extract_index_ivf(index)
+        self.assertTrue(ivf.nprobe == 4)
+        self.assertTrue(faiss.downcast_index(ivf.quantizer).hnsw.efSearch == 4)
+
+    def test_need_rebuild(self):
+        # flat index is never retrained, but int8 quantized one retrains its ranges.
+        flat = self.trained(50)
+        self.assertFalse(self.policy.need_rebuild(flat, 99, 0))
+        self.assertTrue(self.policy.need_rebuild(self.policy.build(16, 50, "sq8"), 99, 0))
+        # migrate up at the threshold.
+        self.assertTrue(self.policy.need_rebuild(flat, 100, 50))
+
+        ivf = self.trained(200)
+        self.assertFalse(self.policy.need_rebuild(ivf, 399, 200))
+        self.assertTrue(self.policy.need_rebuild(ivf, 400, 200))
+        # migrate down only below half of the threshold.
+        self.assertFalse(self.policy.need_rebuild(ivf, 60, 200))
+        self.assertTrue(self.policy.need_rebuild(ivf, 49, 200))
+
+        self.assertTrue(self.policy.need_rebuild(self.policy.build(16, 200), 200, 0))
+
+
+class DeprecationTest(unittest.TestCase):
+
+    @mock.patch("dialobot.core.intent.retriever.SentenceTransformer", HashEncoder)
+    def test_deprecated_params(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            retriever = IntentRetriever(idx_path=tempfile.mkdtemp(), labeling_count=20, retrain_ratio=1.5)
+
+        self.assertTrue(any(issubclass(w.category, DeprecationWarning) for w in caught))
+        self.assertTrue(retriever.index_policy.flat_threshold == 20)
+        self.assertTrue(retriever.index_policy.retrain_ratio == 1.5)
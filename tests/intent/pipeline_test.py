@@ -12,8 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import tempfile
 import unittest
+from unittest import mock
+
+import faiss
+import torch
+
 from dialobot.core.intent.pipeline import Intent
+from tests.intent.classifier_test import StubTokenizer, tiny_nli_model
+from tests.intent.storage_test import HashEncoder
+
+
+def stub_intent(model, **kwargs):
+    with mock.patch("dialobot.core.intent.classifier.RobertaTokenizer", StubTokenizer), \
+            mock.patch("dialobot.core.intent.classifier.load_nli_model", return_value=tiny_nli_model()), \
+            mock.patch("dialobot.core.intent.retriever.SentenceTransformer", HashEncoder):
+        intent = Intent(model=model, lang="en", idx_path=tempfile.mkdtemp(), **kwargs)
+
+    if model != "clf":
+        intent.add([("Tell me today's weather", "weather"),
+                    ("How will the weather be tomorrow?", "weather"),
+                    ("Tell me good restaurant.", "restaurant"),
+                    ("What time is it now?", "time")])
+    return intent
 
 
 class PipelineTest(unittest.TestCase):
@@ -42,3 +65,80 @@ class PipelineTest(unittest.TestCase):
                     ("A lot of new restaurants have started up in the region.", "restaurant")])
         out = intent.recognize("Tell me today's weather", intents=["weather", "restaurant"], detail=True)
         self.assertTrue(out == "weather")
+
+    def test_cascade(self):
+        intent = Intent(model="cascade", lang="en", cascade_topm=2)
+        intent.clear()
+        intent.add(("They do really good food at that restaurant and it's not very expensive either.", "restaurant"))
+        intent.add(("Tell me today's weather", "weather"))
+        intent.add([("How will the weather be tomorrow?", "weather"),
+                    ("A lot of new restaurants have started up in the region.", "restaurant")])
+        out = intent.recognize("Tell me today's weather", intents=["weather", "restaurant"])
+        self.assertTrue(out == "weather")
+        intent.clear()
+
+    def test_arecognize(self):
+        intent = Intent(model="retriever", lang="en")
+        intent.clear()
+        intent.add(("Tell me today's weather", "weather"))
+        intent.add(("Tell me good restaurant.", "restaurant"))
+
+        async def recognize():
+            return await asyncio.gather(
+                intent.arecognize("Tell me tomorrow's weather"),
+                intent.arecognize("Tell me great restaurant"),
+            )
+
+        outs = asyncio.run(recognize())
+        self.assertTrue(outs == ["weather", "restaurant"])
+        intent.clear()
+        intent.close()
+
+
+class StubPipelineTest(unittest.TestCase):
+
+    texts = ["Tell me tomorrow's weather", "Tell me great restaurant", "What time is it?", "hello"]
+
+    def test_recognize_batch(self):
+        # every sentence of cascade model is rescored by classifier.
+        for intent in [stub_intent("clf"), stub_intent("both"), stub_intent("cascade", cascade_threshold=1.1)]:
+            intents = ["weather", "restaurant", "time"]
+            with mock.patch.object(intent.clf, "forward", wraps=intent.clf.forward) as forward:
+                outs = intent.recognize_batch(self.texts, intents=intents, detail=True)
+            self.assertTrue(forward.call_count <= 2)
+            self.assertTrue(outs == [intent.recognize(t, intents=intents, detail=True) for t in self.texts])
+            intent.close()
+
+    def test_arecognize_batch(self):
+        intent = stub_intent("clf")
+        intents = ["weather", "restaurant", "time"]
+
+        async def recognize():
+            return await asyncio.gather(*[intent.arecognize(t, intents=intents) for t in self.texts * 4])
+
+        with mock.patch.object(intent.clf, "recognize_batch", wraps=intent.clf.recognize_batch) as recognize_batch:
+            outs = asyncio.run(recognize())
+
+        # coalesced items are recognized in batches, not one by one.
+        self.assertTrue(recognize_batch.call_count < len(self.texts) * 4)
+        self.assertTrue(outs == [intent.recognize(t, intents=intents) for t in self.texts * 4])
+        intent.close()
+
+    def test_thread_budget(self):
+        num_threads = torch.get_num_threads()
+        try:
+            intent = stub_intent("both", num_threads=4)
+            self.assertTrue(torch.get_num_threads() == 2)
+            self.assertTrue(faiss.omp_get_max_threads() == 2)
+            self.assertTrue(intent.executor is not None)
+            intent.close()
+
+            # stages run one after the other if threads can not be split.
+            intent = stub_intent("both", num_threads=1)
+            self.assertTrue(intent.executor is None)
+            outs = intent.recognize_batch(self.texts, intents=["weather", "restaurant", "time"])
+            self.assertTrue(len(outs) == len(self.texts))
+            intent.close()
+        finally:
+            torch.set_num_threads(num_threads)
+            faiss.omp_set_num_threads(num_threads)
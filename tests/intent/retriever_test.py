@@ -12,8 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 import unittest
-from dialobot.core.intent import IntentRetriever
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from dialobot.core.intent import IntentRetriever, IndexPolicy
+from dialobot.core.utils import EmbeddingCache
+from dialobot.core.utils.backend import OnnxSentenceEncoder
+from tests.intent.storage_test import HashEncoder
 
 
 class RetrieverTest(unittest.TestCase):
@@ -37,6 +48,50 @@ class RetrieverTest(unittest.TestCase):
         self.assertTrue(len(retriever) == 0)
         retriever.clear()
 
+    def test_remove_many(self):
+        retriever = IntentRetriever()
+        retriever.clear()
+        retriever.add([("Tell me today's weather", "weather"), ("Tell me good restaurant.", "restaurant"),
+                       ("What time is it now?", "time")])
+        retriever.remove_many([("Tell me today's weather", "weather"), ("What time is it now?", "time")])
+
+        self.assertTrue(len(retriever) == 1)
+        self.assertTrue(retriever.intents() == ["restaurant"])
+        retriever.clear()
+
+    def test_reload(self):
+        retriever = IntentRetriever()
+        retriever.clear()
+        retriever.add([("Tell me today's weather", "weather"), ("Tell me good restaurant.", "restaurant")])
+        retriever.remove(("Tell me good restaurant.", "restaurant"))
+
+        reloaded = IntentRetriever()
+        self.assertTrue(len(reloaded) == 1)
+        self.assertTrue(("Tell me today's weather", "weather") in reloaded)
+        retriever.clear()
+
+    def test_contains(self):
+        retriever = IntentRetriever()
+        retriever.clear()
+        retriever.add(("Tell me today's weather", "weather"))
+
+        self.assertTrue(("Tell me today's weather", "weather") in retriever)
+        self.assertFalse(("Tell me today's weather", "restaurant") in retriever)
+        retriever.clear()
+
+    def test_intent_counts(self):
+        retriever = IntentRetriever()
+        retriever.clear()
+        retriever.add([("Tell me today's weather", "weather"),
+                       ("How will the weather be tomorrow?", "weather"),
+                       ("Tell me good restaurant.", "restaurant")])
+        retriever.remove(("Tell me good restaurant.", "restaurant"))
+
+        self.assertTrue(retriever.intent_counts() == {"weather": 2})
+        self.assertTrue(retriever.has_intent("weather"))
+        self.assertFalse(retriever.has_intent("restaurant"))
+        retriever.clear()
+
     def test_search(self):
         retriever = IntentRetriever()
         retriever.clear()
@@ -47,6 +102,46 @@ class RetrieverTest(unittest.TestCase):
         self.assertTrue(cls == "restaurant")
         retriever.clear()
 
+    def test_recognize_batch(self):
+        retriever = IntentRetriever()
+        retriever.clear()
+        retriever.add(("Tell me today's weather", "weather"))
+        retriever.add(("Tell me good restaurant.", "restaurant"))
+
+        texts = ["Tell me great restaurant", "hello. my name is Kevin."]
+        outs = retriever.recognize_batch(texts)
+        self.assertTrue(outs == [retriever.recognize(text) for text in texts])
+        retriever.clear()
+
+    def test_compression(self):
+        retriever = IntentRetriever(
+            idx_file="compressed.idx",
+            dataset_file="compressed.pkl",
+            compression="fp16",
+            rerank=10,
+        )
+        retriever.clear()
+        retriever.add(("Tell me today's weather", "weather"))
+        retriever.add(("Tell me good restaurant.", "restaurant"))
+
+        cls = retriever.recognize("Tell me great restaurant")
+        self.assertTrue(cls == "restaurant")
+        retriever.clear()
+
+    def test_cache(self):
+        cache = EmbeddingCache(maxsize=10)
+        retriever = IntentRetriever(cache=cache)
+        retriever.clear()
+        retriever.add(("Tell me today's weather", "weather"))
+        retriever.add(("Tell me good restaurant.", "restaurant"))
+
+        first = retriever.recognize("Tell me great restaurant")
+        second = retriever.recognize(" Tell me  great restaurant ")
+        self.assertTrue(first == second == "restaurant")
+        self.assertTrue(cache.stats()["hits"] == 1)
+        self.assertTrue(cache.stats()["misses"] == 1)
+        retriever.clear()
+
     def test_fallback(self):
         retriever = IntentRetriever()
         retriever.clear()
@@ -56,3 +151,163 @@ class RetrieverTest(unittest.TestCase):
         cls = retriever.recognize("hello. my name is Kevin.")
         self.assertTrue(cls == "fallback")
         retriever.clear()
+
+
+@mock.patch("dialobot.core.intent.retriever.SentenceTransformer", HashEncoder)
+class AppendTest(unittest.TestCase):
+
+    def test_append_without_rebuild(self):
+        policy = IndexPolicy(flat_threshold=100, retrain_ratio=2.0)
+        retriever = IntentRetriever(idx_path=tempfile.mkdtemp(), index_policy=policy)
+        retriever.add([(f"sentence number {i}", "number") for i in range(100)])
+        self.assertTrue(IndexPolicy.kind_of(retriever.index) == "ivf")
+        self.assertTrue(retriever.trained_ntotal == 100)
+
+        with mock.patch.object(retriever, "_rebuild", wraps=retriever._rebuild) as rebuild:
+            retriever.add([(f"sentence number {i}", "number") for i in range(100, 199)])
+            self.assertTrue(rebuild.call_count == 0)
+            self.assertTrue(retriever.trained_ntotal == 100)
+            self.assertTrue(len(retriever) == 199)
+
+            # retrained when the number of data reaches `retrain_ratio` times of the last training.
+            retriever.add(("sentence number 199", "number"))
+            self.assertTrue(rebuild.call_count == 1)
+            self.assertTrue(retriever.trained_ntotal == 200)
+
+    def test_batched_add(self):
+        retriever = IntentRetriever(idx_path=tempfile.mkdtemp())
+        retriever.add(("Tell me today's weather", "weather"))
+
+        with mock.patch.object(retriever.model, "encode", wraps=retriever.model.encode) as encode:
+            retriever.add([("Tell me today's weather", "weather"),
+                           ("Tell me good restaurant.", "restaurant"),
+                           ("Tell me good restaurant.", "restaurant"),
+                           ("What time is it now?", "time")])
+
+            # new sentences are encoded in one call, without duplicates and existing data.
+            self.assertTrue(encode.call_count == 1)
+            self.assertTrue(encode.call_args[0][0] == ["Tell me good restaurant.", "What time is it now?"])
+            self.assertTrue(len(retriever) == 3)
+
+    def test_bulk_add(self):
+        # more sentences than `max_queue` of scheduler are encoded in chunks.
+        retriever = IntentRetriever(idx_path=tempfile.mkdtemp(), batching={"max_batch": 8, "max_queue": 16})
+        retriever.add([(f"sentence number {i}", "number") for i in range(100)])
+        retriever.scheduler.close()
+        self.assertTrue(len(retriever) == 100)
+
+
+@mock.patch("dialobot.core.intent.retriever.SentenceTransformer", HashEncoder)
+class ConcurrencyTest(unittest.TestCase):
+
+    def test_recognize_while_adding(self):
+        policy = IndexPolicy(flat_threshold=100, retrain_ratio=1.2)
+        retriever = IntentRetriever(idx_path=tempfile.mkdtemp(), index_policy=policy)
+        retriever.add([(f"weather of day {i}", "weather") for i in range(10)])
+
+        def add():
+            # index is rebuilt several times while recognizing.
+            for i in range(10, 400, 10):
+                retriever.add([(f"weather of day {j}", "weather") for j in range(i, i + 10)])
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            added = executor.submit(add)
+            while not added.done():
+                outs = retriever.recognize_batch(["weather of day 3", "weather of day 5"])
+                self.assertTrue(outs == ["weather", "weather"])
+            added.result()
+
+
+@mock.patch("dialobot.core.intent.retriever.SentenceTransformer", HashEncoder)
+class CacheTest(unittest.TestCase):
+
+    def test_encode_original_sentence(self):
+        retriever = IntentRetriever(idx_path=tempfile.mkdtemp())
+        texts = ["Ｔell  me today's weather", "Ｔell me today's weather"]
+
+        with mock.patch.object(retriever.model, "encode", wraps=retriever.model.encode) as encode:
+            vectors = retriever._vectorize(texts)
+
+        # sentences with the same key are encoded once, as they are given.
+        self.assertTrue(encode.call_args[0][0] == texts[:1])
+        self.assertTrue(np.allclose(vectors, retriever._vectorize(texts[:1] * 2, use_cache=False)))
+
+
+class VotingTest(unittest.TestCase):
+
+    @mock.patch("dialobot.core.intent.retriever.SentenceTransformer", HashEncoder)
+    def setUp(self):
+        self.retriever = IntentRetriever(idx_path=tempfile.mkdtemp(), fallback_threshold=0.6)
+        self.retriever.add([("Tell me today's weather", "weather"),
+                            ("Tell me good restaurant.", "restaurant"),
+                            ("I'm hungry. Tell me restaurants", "restaurant")])
+        self.ids = {s: i for (s, _), i in self.retriever.lookup.items()}
+
+    def vote(self, neighbors, voting):
+        dists = np.array([[d for d, _ in row] for row in neighbors], dtype=np.float32)
+        indices = np.array([[self.ids.get(s, -1) for _, s in row] for row in neighbors], dtype=np.int64)
+        winners, is_fallback, best = self.retriever._vote(dists, indices, voting)
+        labels = self.retriever.dataset.labels
+        return ["fallback" if f else labels[w] for w, f in zip(winners, is_fallback)], best
+
+    def test_soft_and_hard(self):
+        neighbors = [[(0.9, "Tell me today's weather"),
+                      (0.5, "Tell me good restaurant."),
+                      (0.45, "I'm hungry. Tell me restaurants")]]
+
+        self.assertTrue(self.vote(neighbors, "soft")[0] == ["restaurant"])
+        self.assertTrue(self.vote(neighbors, "hard")[0] == ["restaurant"])
+
+        neighbors = [[(0.9, "Tell me today's weather"), (0.3, "Tell me good restaurant.")]]
+        self.assertTrue(self.vote(neighbors, "soft")[0] == ["weather"])
+
+    def test_ties(self):
+        # tied votes are won by the most similar neighbor, and then by the first neighbor.
+        neighbors = [[(0.7, "Tell me good restaurant."), (0.9, "Tell me today's weather")],
+                     [(0.8, "Tell me good restaurant."), (0.8, "Tell me today's weather")]]
+        self.assertTrue(self.vote(neighbors, "hard")[0] == ["weather", "restaurant"])
+
+    def test_fallback_and_scores(self):
+        neighbors = [[(0.9, "Tell me today's weather"), (0.7, "Tell me good restaurant."), (0.0, None)],
+                     [(0.5, "Tell me today's weather"), (0.0, None), (0.0, None)],
+                     [(0.0, None), (0.0, None), (0.0, None)]]
+        intents, best = self.vote(neighbors, "soft")
+        self.assertTrue(intents == ["weather", "fallback", "fallback"])
+
+        labels = self.retriever.dataset.labels
+        self.assertTrue(best[0][labels.index("restaurant")] == np.float32(0.7))
+        self.assertTrue(np.isneginf(best[1][labels.index("restaurant")]))
+
+
+class OnnxEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        from sentence_transformers import SentenceTransformer, models
+        from transformers import BertConfig, BertModel, BertTokenizer
+
+        # tiny random sentence transformer, not to download models in tests.
+        path = tempfile.mkdtemp()
+        words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "tell", "me", "today", "weather", "good"]
+        with open(os.path.join(path, "vocab.txt"), "w") as f:
+            f.write("\n".join(words))
+
+        torch.manual_seed(0)
+        BertTokenizer(os.path.join(path, "vocab.txt")).save_pretrained(path)
+        BertModel(BertConfig(
+            vocab_size=len(words),
+            hidden_size=16,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            intermediate_size=32,
+        )).save_pretrained(path)
+
+        self.model = SentenceTransformer(modules=[models.Transformer(path), models.Pooling(16)])
+        self.encoder = OnnxSentenceEncoder(self.model, "tiny", cache_path=tempfile.mkdtemp())
+
+    def test_encode(self):
+        sentences = ["tell me today weather", "good", "tell me good weather today"]
+        self.assertTrue(np.allclose(self.encoder.encode(sentences, batch_size=2),
+                                    self.model.encode(sentences), atol=1e-4))
+
+    def test_empty(self):
+        self.assertTrue(self.encoder.encode([]).shape == (0, 16))
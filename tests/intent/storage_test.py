@@ -0,0 +1,123 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import zlib
+import hashlib
+import warnings
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from dialobot.core.intent import IntentRetriever
+from dialobot.core.intent.storage import RetrieverStorage, _HEADER
+
+
+class HashEncoder:
+    """
+    Sentence encoder which embeds words by hashing, not to download models in tests.
+    """
+
+    def __init__(self, model, *args, **kwargs):
+        pass
+
+    def to(self, device):
+        return self
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        vectors = np.zeros((len(sentences), 384), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            for word in sentence.lower().split():
+                vectors[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % 384] += 1.0
+        return vectors
+
+
+@mock.patch("dialobot.core.intent.retriever.SentenceTransformer", HashEncoder)
+class StorageTest(unittest.TestCase):
+
+    def test_log_format(self):
+        path = tempfile.mkdtemp()
+        storage = RetrieverStorage(idx_path=path, idx_file="intent.idx", dataset_file="dataset.pkl")
+        storage.append("remove", np.array([3], dtype=np.int64))
+        storage.append("clear")
+        storage.close()
+
+        segment = storage._segment_file(storage.segment)
+        size = os.path.getsize(segment)
+        with open(segment, mode="rb") as f:
+            length, crc = _HEADER.unpack(f.read(_HEADER.size))
+            self.assertTrue(zlib.crc32(f.read(length)) == crc)
+
+        # a torn record left by a crash while appending is truncated.
+        with open(segment, mode="ab") as f:
+            f.write(_HEADER.pack(100, 0) + b"torn")
+
+        records = list(RetrieverStorage(path, "intent.idx", "dataset.pkl").load()[2])
+        self.assertTrue([r[0] for r in records] == ["remove", "clear"])
+        self.assertTrue(records[0][1].tolist() == [3])
+        self.assertTrue(os.path.getsize(segment) == size)
+
+    def test_replay_remove_first(self):
+        path = tempfile.mkdtemp()
+        retriever = IntentRetriever(idx_path=path)
+        retriever.add([("Tell me today's weather", "weather"), ("Tell me good restaurant.", "restaurant")])
+        retriever.checkpoint()
+        # the first record of the log after the checkpoint is a remove.
+        retriever.remove(("Tell me good restaurant.", "restaurant"))
+
+        reloaded = IntentRetriever(idx_path=path)
+        self.assertTrue(len(reloaded) == 1)
+        self.assertTrue(("Tell me today's weather", "weather") in reloaded)
+        self.assertFalse(("Tell me good restaurant.", "restaurant") in reloaded)
+
+    def test_checkpoint_error(self):
+        path = tempfile.mkdtemp()
+        retriever = IntentRetriever(idx_path=path, checkpoint_interval=1)
+
+        with mock.patch.object(retriever.storage, "checkpoint", side_effect=OSError("disk full")):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                retriever.add(("Tell me today's weather", "weather"))
+                retriever._checkpoint_thread.join()
+            self.assertTrue(len(caught) == 1)
+
+        # the failure is raised by the next checkpoint, which is written again.
+        with self.assertRaises(Exception):
+            retriever.checkpoint()
+        retriever.checkpoint()
+
+        reloaded = IntentRetriever(idx_path=path)
+        self.assertTrue(("Tell me today's weather", "weather") in reloaded)
+
+    def test_rebase_after_checkpoint(self):
+        retriever = IntentRetriever(idx_path=tempfile.mkdtemp(), checkpoint_interval=2)
+        retriever.add([("Tell me today's weather", "weather"), ("Tell me good restaurant.", "restaurant")])
+        retriever.add(("What time is it now?", "time"))
+        retriever._checkpoint_thread.join()
+
+        # mutations after the snapshot are kept while saved data are read from columns.
+        retriever.remove(("Tell me today's weather", "weather"))
+        retriever.add(("How will the weather be tomorrow?", "weather"))
+        dataset = retriever.dataset
+        self.assertTrue(isinstance(dataset.vectors, np.memmap))
+        self.assertTrue(len(dataset.delta) == 1)
+        self.assertTrue(len(dataset) == 3)
+        self.assertTrue(dataset.counts == {"weather": 1, "restaurant": 1, "time": 1})
+
+        retriever.checkpoint()
+        self.assertTrue(len(retriever.dataset.delta) == 0)
+        self.assertTrue(retriever.recognize("How will the weather be tomorrow?") == "weather")
+        self.assertFalse(("Tell me today's weather", "weather") in retriever)
@@ -0,0 +1,45 @@
+# Copyright (c) 2021, Hyunwoong Ko. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from dialobot.core.utils.scheduler import MicroBatchScheduler
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_backpressure(self):
+        scheduler = MicroBatchScheduler(lambda items: [item * 2 for item in items], max_batch=4, max_queue=8)
+
+        # more items than `max_queue` wait for space instead of being rejected.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            outs = list(executor.map(lambda begin: scheduler.map(list(range(begin, begin + 50))), [0, 50, 100, 150]))
+
+        metrics = scheduler.metrics()
+        scheduler.close()
+        self.assertTrue(sum(outs, []) == [i * 2 for i in range(200)])
+        self.assertTrue(metrics["completed"] == 200 and metrics["closed_rejections"] == 0)
+        self.assertTrue(metrics["blocked"] > 0)
+        self.assertTrue(metrics["queue_depth"] == 0)
+
+    def test_closed(self):
+        scheduler = MicroBatchScheduler(lambda items: items)
+        self.assertTrue(scheduler.map([1, 2]) == [1, 2])
+        scheduler.close()
+
+        with self.assertRaises(Exception):
+            scheduler.submit_many([3, 4])
+        self.assertTrue(scheduler.metrics()["closed_rejections"] == 2)